@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, m2m_changed
 from ProductsApp.models import Products
 from cryptography.fernet import Fernet
 from django.conf import settings
@@ -55,3 +57,53 @@ def auto_add_profile(sender, instance, created, **kwargs):
         profile = Profile(user = instance)
         profile.save()
 
+
+
+# Keep Products.wishlist_count in step with Wishlist.products
+@receiver(m2m_changed, sender=Wishlist.products.through)
+def update_wishlist_count(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Wishlist.products.through
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() reports every id it was given, so count only the rows that exist
+        if reverse:
+            rows = through.objects.filter(products_id=instance.pk)
+            if pk_set is not None:
+                rows = rows.filter(wishlist_id__in=pk_set)
+            instance._wishlist_removed = rows.count()
+        else:
+            rows = through.objects.filter(wishlist_id=instance.pk)
+            if pk_set is not None:
+                rows = rows.filter(products_id__in=pk_set)
+            instance._wishlist_removed = list(rows.values_list('products_id', flat=True))
+        return
+    if action == 'post_add':
+        delta, removed = 1, None
+    elif action in ('post_remove', 'post_clear'):
+        delta, removed = -1, getattr(instance, '_wishlist_removed', None)
+        instance._wishlist_removed = None
+    else:
+        return
+    if reverse:
+        amount = len(pk_set) if action == 'post_add' else removed
+        if amount:
+            Products.objects.filter(pk=instance.pk).update(wishlist_count=F('wishlist_count') + delta * amount)
+    else:
+        product_ids = pk_set if action == 'post_add' else removed
+        if product_ids:
+            Products.objects.filter(pk__in=product_ids).update(wishlist_count=F('wishlist_count') + delta)
+
+
+def reconcile_wishlist_counts(queryset=None):
+    """Recompute drifted Products.wishlist_count values; returns the fixed product ids."""
+    if queryset is None:
+        queryset = Products.objects.all()
+    rows = Wishlist.products.through.objects.filter(products=OuterRef('pk')).order_by().values('products')
+    actual = Coalesce(Subquery(rows.annotate(total=Count('pk')).values('total')), 0)
+    drifted = list(
+        queryset.annotate(actual_wishlist_count=actual)
+        .exclude(wishlist_count=F('actual_wishlist_count'))
+        .values_list('pk', flat=True)
+    )
+    if drifted:
+        Products.objects.filter(pk__in=drifted).update(wishlist_count=actual)
+    return drifted
@@ -1,6 +1,7 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import Profile, Wishlist, reconcile_wishlist_counts
+from ProductsApp.models import Products
 from rest_framework.test import APITestCase
 from rest_framework import status
 
@@ -71,3 +72,44 @@ class UserAuthenticationTests(APITestCase):
         response = self.client.post(verify_url, {'code': '123456'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('message', response.data)
+
+
+class WishlistCountTests(TestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='pass')
+        self.products = [
+            Products.objects.create(name=f'P{i}', brand='B', category='Computer', price=1, description='d', user=vendor)
+            for i in range(3)
+        ]
+        self.wishlists = [
+            Wishlist.objects.create(user=User.objects.create_user(username=f'u{i}', password='pass')) for i in range(2)
+        ]
+
+    def counts(self):
+        for product in self.products:
+            product.refresh_from_db(fields=['wishlist_count'])
+        return [product.wishlist_count for product in self.products]
+
+    def test_counter_follows_both_sides_of_the_relation(self):
+        """Test add/remove/clear from the wishlist and from the product side."""
+        first, second = self.wishlists
+        first.products.add(self.products[0], self.products[1])
+        first.products.add(self.products[0])  # already there
+        second.products.add(self.products[0])
+        self.assertEqual(self.counts(), [2, 1, 0])
+        first.products.remove(self.products[1], self.products[2])  # P2 was never added
+        self.assertEqual(self.counts(), [2, 0, 0])
+        self.products[2].wishlisted_by.add(first, second)
+        self.products[0].wishlisted_by.remove(second)
+        self.assertEqual(self.counts(), [1, 0, 2])
+        self.products[2].wishlisted_by.clear()
+        first.products.clear()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    def test_reconcile_fixes_drift(self):
+        """Test that reconciliation repairs counters changed behind the receiver's back."""
+        self.wishlists[0].products.add(self.products[0])
+        Products.objects.filter(pk=self.products[0].pk).update(wishlist_count=7)
+        self.assertEqual(reconcile_wishlist_counts(), [self.products[0].pk])
+        self.assertEqual(self.counts(), [1, 0, 0])
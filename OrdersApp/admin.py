@@ -1,5 +1,24 @@
+from django import forms
 from django.contrib import admin
 from .models import Order, OrderItem
 # Register your models here.
-admin.site.register(Order)
-admin.site.register(OrderItem)
\ No newline at end of file
+
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        if self.instance.pk and not self.instance.can_transition_to(status):
+            raise forms.ValidationError(f"Order status cannot change from {self.instance._loaded_status} to {status}.")
+        return status
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
+
+
+admin.site.register(OrderItem)
@@ -0,0 +1,262 @@
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ProductsApp.models import Products
+from ProductsApp.trending import on_commit_record
+from .models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+# Each active cart is a Redis hash of product id -> "quantity:added_at". The
+# LOADED_FIELD marker tells an empty cart apart from one not read from the
+# database yet. Users whose hash changed are kept in DIRTY_KEY until
+# flush_dirty_carts() writes them back to Cart/CartItem.
+LOADED_FIELD = '_loaded'
+DIRTY_KEY = 'carts:dirty'
+CART_TIMEOUT = getattr(settings, 'CART_STORE_TIMEOUT', 60 * 60 * 24 * 7)
+FLUSH_BATCH = getattr(settings, 'CART_STORE_FLUSH_BATCH', 500)
+
+
+def enabled():
+    return getattr(settings, 'CART_STORE', 'database') == 'redis'
+
+
+def get_client():
+    # The raw connection behind the 'default' django-redis cache
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def cart_key(user_id):
+    return f'carts:user:{user_id}'
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _decode(raw):
+    """{product id: (quantity, added_at)} of a hash read with HGETALL."""
+    entries = {}
+    for field, value in raw.items():
+        field = _text(field)
+        if field == LOADED_FIELD:
+            continue
+        quantity, added_at = _text(value).split(':')
+        entries[field] = (int(quantity), float(added_at))
+    return entries
+
+
+def load_entries(user_id):
+    """
+    The user's cart entries, read from the database into Redis the first
+    time the cart is touched. HSETNX never overwrites a change another
+    request made while this one was loading.
+    """
+    client = get_client()
+    key = cart_key(user_id)
+    raw = client.hgetall(key)
+    if LOADED_FIELD.encode() not in raw and LOADED_FIELD not in raw:
+        rows = CartItem.objects.filter(cart__user_id=user_id).values_list('product_id', 'quantity', 'date_added')
+        pipe = client.pipeline(transaction=False)
+        for product_id, quantity, date_added in rows:
+            pipe.hsetnx(key, str(product_id), f'{quantity}:{date_added.timestamp()}')
+        pipe.hsetnx(key, LOADED_FIELD, 1)
+        pipe.expire(key, CART_TIMEOUT)
+        pipe.execute()
+        raw = client.hgetall(key)
+    return _decode(raw)
+
+
+def _touch(client, key, user_id):
+    # Mark dirty only after the hash changed, so a flush never misses it
+    pipe = client.pipeline(transaction=False)
+    pipe.expire(key, CART_TIMEOUT)
+    pipe.sadd(DIRTY_KEY, user_id)
+    pipe.execute()
+
+
+def _by_pk(entries):
+    return {Products._meta.pk.to_python(product_id): entry for product_id, entry in entries.items()}
+
+
+def get_quantity(user_id, product_id):
+    entry = load_entries(user_id).get(str(product_id))
+    return entry[0] if entry else None
+
+
+def set_item(user_id, product_id, quantity):
+    entries = load_entries(user_id)
+    client = get_client()
+    key = cart_key(user_id)
+    added_at = entries.get(str(product_id), (None, time.time()))[1]
+    client.hset(key, str(product_id), f'{quantity}:{added_at}')
+    _touch(client, key, user_id)
+    if str(product_id) not in entries:
+        # bulk_create in the flush skips the CartItem signals
+        on_commit_record([product_id], 'cart')
+
+
+def remove_item(user_id, product_id):
+    """Drop one product from the cart; False when it was not in it."""
+    if str(product_id) not in load_entries(user_id):
+        return False
+    client = get_client()
+    key = cart_key(user_id)
+    client.hdel(key, str(product_id))
+    _touch(client, key, user_id)
+    return True
+
+
+def clear_cart(user_id):
+    client = get_client()
+    key = cart_key(user_id)
+    pipe = client.pipeline(transaction=False)
+    pipe.delete(key)
+    pipe.hset(key, LOADED_FIELD, 1)
+    pipe.execute()
+    _touch(client, key, user_id)
+
+
+def get_cart(user):
+    """
+    The user's Cart with its items taken from Redis, in the shape
+    CartSerializer.setup_eager_loading gives. Items that were not flushed
+    yet have no id.
+    """
+    entries = _by_pk(load_entries(user.pk))
+    cart = Cart.objects.get(user=user)
+    products = Products.objects.in_bulk(list(entries))
+    items = []
+    for pk, (quantity, added_at) in sorted(entries.items(), key=lambda entry: -entry[1][1]):
+        if pk in products:
+            item = CartItem(cart=cart, product=products[pk], quantity=quantity)
+            item.date_added = datetime.fromtimestamp(added_at, tz=dt_timezone.utc)
+            items.append(item)
+    cart._prefetched_objects_cache = {'items': items}
+    return cart
+
+
+def flush_cart(user_id):
+    """
+    Write one user's Redis cart to Cart/CartItem (used by checkout) and
+    return the entries written, or None when the cart is not in Redis.
+    """
+    raw = get_client().hgetall(cart_key(user_id))
+    if not write_carts({user_id: raw}):
+        return None
+    return _decode(raw)
+
+
+def flush_carts(user_ids):
+    """Write the Redis carts of `user_ids` back; returns the number written."""
+    client = get_client()
+    pipe = client.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.hgetall(cart_key(user_id))
+    return write_carts(dict(zip(user_ids, pipe.execute())))
+
+
+def write_carts(raw_by_user):
+    """
+    Write {user id: HGETALL reply} to Cart/CartItem in one transaction with
+    a fixed number of queries, whatever the batch size. The whole hash is
+    the truth, so repeating a flush is harmless. Carts that were never
+    loaded into Redis are left alone; users whose Cart row is gone are
+    dropped. Returns the number of carts written.
+    """
+    carts_by_user = {}
+    for user_id, raw in raw_by_user.items():
+        if LOADED_FIELD.encode() in raw or LOADED_FIELD in raw:
+            carts_by_user[user_id] = {pk: quantity for pk, (quantity, _) in _by_pk(_decode(raw)).items()}
+    if not carts_by_user:
+        return 0
+
+    with transaction.atomic():
+        carts = {cart.user_id: cart for cart in Cart.objects.select_for_update().filter(user_id__in=list(carts_by_user))}
+        missing = set(carts_by_user) - set(carts)
+        if missing:
+            logger.warning('Dropping the Redis carts of users %s, who have no Cart row', sorted(missing))
+            for user_id in missing:
+                del carts_by_user[user_id]
+        existing = {}
+        for item in CartItem.objects.filter(cart__in=list(carts.values())).only('id', 'cart_id', 'product_id', 'quantity'):
+            existing[(item.cart_id, item.product_id)] = item
+        wanted = {
+            (carts[user_id].pk, product_id): quantity
+            for user_id, entries in carts_by_user.items()
+            for product_id, quantity in entries.items()
+        }
+        stale = [item.pk for key, item in existing.items() if key not in wanted]
+        changed = []
+        for key, quantity in wanted.items():
+            item = existing.get(key)
+            if item is not None and item.quantity != quantity:
+                item.quantity = quantity
+                changed.append(item)
+        # Products deleted since they were added are dropped
+        new_products = {product_id for (cart_id, product_id) in wanted if (cart_id, product_id) not in existing}
+        alive = set(Products.objects.filter(pk__in=list(new_products)).values_list('pk', flat=True))
+        if stale:
+            CartItem.objects.filter(pk__in=stale).delete()
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity'])
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+            for (cart_id, product_id), quantity in wanted.items()
+            if (cart_id, product_id) not in existing and product_id in alive
+        ])
+        Cart.objects.filter(pk__in=[cart.pk for cart in carts.values()]).update(updated_at=timezone.now())
+    return len(carts_by_user)
+
+
+def flush_dirty_carts(batch_size=FLUSH_BATCH):
+    """Write-behind pass run by the beat schedule; returns the carts written."""
+    client = get_client()
+    flushed = 0
+    while True:
+        user_ids = [int(_text(user_id)) for user_id in client.spop(DIRTY_KEY, batch_size) or []]
+        if not user_ids:
+            return flushed
+        try:
+            flushed += flush_carts(user_ids)
+        except Exception:
+            logger.exception('Could not write back the carts of %s users', len(user_ids))
+            # Retried on the next pass rather than lost
+            client.sadd(DIRTY_KEY, *user_ids)
+            return flushed
+        if len(user_ids) < batch_size:
+            return flushed
+
+
+def forget_cart(user_id, ordered):
+    """
+    Drop the `ordered` entries ({product id: (quantity, added_at)}) from the
+    Redis cart once checkout emptied the database cart. Entries added or
+    changed since checkout read the cart stay, and are flushed again.
+    """
+    from redis.exceptions import WatchError
+    client = get_client()
+    key = cart_key(user_id)
+    with client.pipeline() as pipe:
+        while True:
+            try:
+                # WATCH makes the compare and the delete one step
+                pipe.watch(key)
+                entries = _decode(pipe.hgetall(key))
+                checked_out = [field for field, entry in entries.items() if ordered.get(field) == entry]
+                pipe.multi()
+                if checked_out:
+                    pipe.hdel(key, *checked_out)
+                if len(checked_out) == len(entries):
+                    pipe.srem(DIRTY_KEY, user_id)
+                else:
+                    pipe.sadd(DIRTY_KEY, user_id)
+                pipe.execute()
+                return
+            except WatchError:
+                # The cart changed in between; compare against the new contents
+                continue
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OrdersApp', '0002_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRestock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('restocked_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='restock', to='OrdersApp.order')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OrdersApp', '0003_order_restock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='OrdersApp.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'changed_at'], name='order_status_history_idx'), models.Index(fields=['to_status', 'changed_at'], name='order_status_to_idx')],
+            },
+        ),
+    ]
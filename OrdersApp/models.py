@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 from ProductsApp.models import Products
+from ProductsApp.cache import invalidate_products
 from django.dispatch import receiver
 from django.db.models.signals import post_save, pre_save
 from decimal import Decimal
@@ -8,6 +11,13 @@ from django.utils import timezone
 from django.core.exceptions import ValidationError
 
 
+class OrderStatusConflict(ValidationError):
+    """The order's status changed in the database after this instance was loaded"""
+
+    def __init__(self, order):
+        super().__init__(f"Order {order.pk} was updated by someone else; reload it and try again.", code='conflict')
+
+
 @receiver(post_save, sender=User)
 def create_cart_for_new_user(sender, instance, created, **kwargs):
     """Create a new cart when a user is created"""
@@ -15,18 +25,6 @@ def create_cart_for_new_user(sender, instance, created, **kwargs):
         Cart.objects.create(user=instance)
 
 
-@receiver(pre_save, sender='OrdersApp.Order')
-def update_delivered_timestamp(sender, instance, **kwargs):
-    """Set delivered_at timestamp when order status changes to Delivered"""
-    if instance.pk:  # if this is an update, not a new creation
-        try:
-            old_instance = sender.objects.get(pk=instance.pk)
-            if old_instance.status != 'Delivered' and instance.status == 'Delivered':
-                instance.delivered_at = timezone.now()
-        except sender.DoesNotExist:
-            pass
-
-
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -36,13 +34,26 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart {self.id} for {self.user.username}"
         
+    def prefetched_items(self):
+        # Items loaded by CartSerializer.setup_eager_loading, or None
+        return getattr(self, '_prefetched_objects_cache', {}).get('items')
+
     def get_total_price(self):
         """Calculate the total price of all items in the cart"""
-        return sum(item.get_total() for item in self.items.all())
-        
+        items = self.prefetched_items()
+        if items is not None:
+            return sum((item.get_total() for item in items), Decimal('0.00'))
+        total = self.items.aggregate(
+            total=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )['total']
+        return total or Decimal('0.00')
+
     def get_total_items(self):
         """Get the total number of items in the cart"""
-        return sum(item.quantity for item in self.items.all())
+        items = self.prefetched_items()
+        if items is not None:
+            return sum(item.quantity for item in items)
+        return self.items.aggregate(total=Sum('quantity'))['total'] or 0
     
     def clear(self):
         """Remove all items from the cart"""
@@ -90,6 +101,15 @@ class Order(models.Model):
         ('Delivered', 'Delivered'),
         ('Cancelled', 'Cancelled'),
     ]
+
+    # Allowed status changes; Delivered and Cancelled are final
+    TRANSITIONS = {
+        'Pending': {'Processing', 'Cancelled'},
+        'Processing': {'Shipped', 'Cancelled'},
+        'Shipped': {'Delivered'},
+        'Delivered': set(),
+        'Cancelled': set(),
+    }
     
     PAYMENT_STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -135,7 +155,12 @@ class Order(models.Model):
     
     def can_cancel(self):
         """Check if order can be cancelled"""
-        return self.status in ['Pending', 'Processing']
+        return 'Cancelled' in self.TRANSITIONS.get(self.status, ())
+
+    def can_transition_to(self, status):
+        """Check if the stored status may move to `status` (staying put is always allowed)"""
+        current = getattr(self, '_loaded_status', None) or self.status
+        return status == current or status in self.TRANSITIONS.get(current, ())
     
     def can_be_reviewed(self):
         """Check if items in this order can be reviewed"""
@@ -144,6 +169,27 @@ class Order(models.Model):
     def __str__(self):
         return f"Order {self.id} by {self.user.username if self.user else 'Unknown'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so a save can tell whether it changed
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        expected = getattr(self, '_loaded_status', None)
+        if self._state.adding or expected is None or (update_fields is not None and 'status' not in update_fields):
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            # Compare-and-set against the status this instance was loaded with, so a
+            # stale instance can never overwrite a newer status. The UPDATE also holds
+            # the row lock until the save below commits.
+            claimed = Order.objects.filter(pk=self.pk, status=expected).update(status=expected)
+            if not claimed and Order.objects.filter(pk=self.pk).exists():
+                raise OrderStatusConflict(self)
+            super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -162,6 +208,12 @@ class OrderItem(models.Model):
         related_name='order_item'
     )
 
+    class Meta:
+        indexes = [
+            # product -> orders lookups (co-purchases, "has bought") without touching the table
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product_name} in Order {self.order.id}"
         
@@ -176,20 +228,115 @@ class OrderItem(models.Model):
                 self.order.delivered_at is not None)
 
 
+def decrement_stock(quantities):
+    """
+    Take {product id: quantity} out of stock with one conditional UPDATE
+    (`stock = stock - qty WHERE stock >= qty`). Raises ValidationError and
+    changes nothing unless every product had enough stock.
+    """
+    enough = Q()
+    for product_id, quantity in quantities.items():
+        enough |= Q(pk=product_id, stock__gte=quantity)
+    with transaction.atomic():
+        updated = Products.objects.filter(enough).update(
+            stock=Case(*[When(pk=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()])
+        )
+        if updated != len(quantities):
+            raise ValidationError("Not enough stock for every item in the order")
+    # After commit, or a concurrent read could cache the old stock again
+    product_ids = list(quantities)
+    transaction.on_commit(lambda: invalidate_products(product_ids))
+
+
 @receiver(post_save, sender=OrderItem)
-def track_product_stock(sender, instance, created, **kwargs):
+def track_product_stock(sender, instance, created, raw=False, **kwargs):
     """Update product stock when order item is created"""
-    if created and instance.product:
-        product = instance.product
-        product.stock = max(0, product.stock - instance.quantity)
-        product.save()
+    if created and not raw and instance.product_id:
+        # One atomic UPDATE instead of a read-modify-write of the whole row
+        Products.objects.filter(pk=instance.product_id).update(stock=Greatest(F('stock') - instance.quantity, 0))
+        product_id = instance.product_id
+        transaction.on_commit(lambda: invalidate_products([product_id]))
+
+
+class OrderRestock(models.Model):
+    # Ledger of cancelled orders whose items went back to stock; one row per order makes it exactly-once
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='restock')
+    restocked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Restock of order {self.order_id}"
+
+
+def restock_order(order):
+    """
+    Put the items of a cancelled order back into stock with one UPDATE.
+    Returns False when the order was already restocked.
+    """
+    with transaction.atomic():
+        _, created = OrderRestock.objects.get_or_create(order=order)
+        if not created:
+            return False
+        quantities = dict(
+            order.items.filter(product__isnull=False).order_by()
+            .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+        )
+        if quantities:
+            Products.objects.filter(pk__in=quantities).update(
+                stock=Case(*[When(pk=product_id, then=F('stock') + total) for product_id, total in quantities.items()])
+            )
+            product_ids = list(quantities)
+            transaction.on_commit(lambda: invalidate_products(product_ids))
+    return True
+
+
+class OrderStatusHistory(models.Model):
+    # One row per status change, written by dispatch_status_change
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_history')
+    from_status = models.CharField(max_length=20, blank=True)  # empty for the initial status
+    to_status = models.CharField(max_length=20)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'changed_at'], name='order_status_history_idx'),
+            models.Index(fields=['to_status', 'changed_at'], name='order_status_to_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status or '-'} -> {self.to_status}"
+
+
+@receiver(pre_save, sender=Order)
+def check_status_transition(sender, instance, raw=False, **kwargs):
+    """Validate a status change against Order.TRANSITIONS and stamp delivered_at"""
+    instance._status_change = None
+    if raw:
+        return
+    if instance._state.adding:
+        instance._status_change = ('', instance.status)
+        return
+    previous = getattr(instance, '_loaded_status', None)
+    if previous is None:
+        # Only instances that were not loaded with their status pay for a lookup
+        previous = sender.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+    if previous is None or previous == instance.status:
+        return
+    if instance.status not in Order.TRANSITIONS.get(previous, ()):
+        raise ValidationError(f"Order status cannot change from {previous} to {instance.status}")
+    if instance.status == 'Delivered':
+        instance.delivered_at = timezone.now()
+    instance._status_change = (previous, instance.status)
 
 
 @receiver(post_save, sender=Order)
-def handle_order_cancellation(sender, instance, **kwargs):
-    """Return products to stock if order is cancelled"""
-    if instance.status == 'Cancelled':
-        for item in instance.items.all():
-            if item.product:
-                item.product.stock += item.quantity
-                item.product.save()
+def dispatch_status_change(sender, instance, raw=False, **kwargs):
+    """Single place for everything that follows a status change"""
+    change = getattr(instance, '_status_change', None)
+    instance._status_change = None
+    if raw or change is None:
+        return
+    instance._loaded_status = instance.status
+    previous, current = change
+    OrderStatusHistory.objects.create(order=instance, from_status=previous, to_status=current)
+    if current == 'Cancelled':
+        restock_order(instance)
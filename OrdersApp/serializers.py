@@ -1,13 +1,18 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Order, OrderItem, Cart, CartItem
+from .models import Order, OrderItem, Cart, CartItem, decrement_stock
+from . import cart_store
 from ProductsApp.models import Products, Reviews
+from ProductsApp.trending import on_commit_record
 
 
 class ProductMiniSerializer(serializers.ModelSerializer):
     """Minimal Product representation for cart/order items"""
     class Meta:
         model = Products
-        fields = ['id', 'name', 'image', 'price', 'stock']
+        fields = ['id', 'name', 'image', 'image_thumbnail', 'price', 'stock']
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -27,7 +32,7 @@ class CartItemSerializer(serializers.ModelSerializer):
     def validate(self, data):
         """Validate product exists and has sufficient stock"""
         try:
-            product = Products.objects.get(id=data['product_id'])
+            product = Products.objects.only('id', 'stock').get(id=data['product_id'])
             if data['quantity'] > product.stock:
                 raise serializers.ValidationError(
                     f"Cannot add {data['quantity']} items. Only {product.stock} in stock."
@@ -35,12 +40,20 @@ class CartItemSerializer(serializers.ModelSerializer):
         except Products.DoesNotExist:
             raise serializers.ValidationError("Product not found")
         
+        # Reused by create() instead of a second lookup
+        data['product'] = product
         return data
     
     def create(self, validated_data):
-        product_id = validated_data.pop('product_id')
-        product = Products.objects.get(id=product_id)
+        validated_data.pop('product_id')
+        product = validated_data.pop('product')
         
+        if cart_store.enabled():
+            # Written back to CartItem later by the flush_cart_store task
+            user = self.context['request'].user
+            cart_store.set_item(user.pk, product.pk, validated_data['quantity'])
+            return CartItem(product=product, quantity=validated_data['quantity'])
+
         # Get or create cart item
         cart = self.context['request'].user.cart
         cart_item, created = CartItem.objects.get_or_create(
@@ -66,6 +79,17 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['id', 'created_at', 'updated_at', 'is_active', 'items', 'total_price', 'total_items']
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Load the cart items joined with their products in one extra query;
+        the totals are then summed from those rows, so a cart renders in
+        two queries however many items it holds.
+        """
+        return queryset.prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('product'))
+        )
     
     def get_total_price(self, obj):
         return obj.get_total_price()
@@ -132,34 +156,69 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         user = self.context['request'].user
+        flushed = None
+        if cart_store.enabled():
+            # Checkout reads the database cart, so write the Redis one first
+            flushed = cart_store.flush_cart(user.pk)
         cart = Cart.objects.get(user=user)
-        
-        # Check if cart has items
-        if not cart.items.exists():
-            raise serializers.ValidationError({"cart": "Cart is empty"})
-        
-        # Create the order
-        order = Order.objects.create(
-            user=user,
-            from_cart=cart,
-            total_amount=cart.get_total_price(),
-            **validated_data
-        )
-        
-        # Create order items from cart items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                product_name=cart_item.product.name,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price,
-                original_cart_item=cart_item
+
+        with transaction.atomic():
+            cart_items = list(cart.items.order_by('product_id').values('id', 'product_id', 'quantity', 'date_added'))
+            if not cart_items:
+                raise serializers.ValidationError({"cart": "Cart is empty"})
+
+            # Lock every product of the order at once, always in pk order so
+            # concurrent checkouts of overlapping carts cannot deadlock
+            product_ids = [item['product_id'] for item in cart_items]
+            products = Products.objects.select_for_update().filter(pk__in=product_ids).order_by('pk')
+            products = {product.pk: product for product in products.only('id', 'name', 'price', 'stock')}
+
+            errors = {}
+            for item in cart_items:
+                product = products.get(item['product_id'])
+                if product is None:
+                    errors[str(item['product_id'])] = "Product is no longer available"
+                elif item['quantity'] > product.stock:
+                    errors[str(product.pk)] = f"Cannot order {item['quantity']} items. Only {product.stock} in stock."
+            if errors:
+                raise serializers.ValidationError({"stock": errors})
+
+            order = Order.objects.create(
+                user=user,
+                from_cart=cart,
+                total_amount=sum(products[item['product_id']].price * item['quantity'] for item in cart_items),
+                **validated_data
             )
-        
-        # Clear the cart after creating order
-        cart.clear()
-        
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=products[item['product_id']],
+                    product_name=products[item['product_id']].name,
+                    quantity=item['quantity'],
+                    price=products[item['product_id']].price,
+                    original_cart_item_id=item['id'],
+                )
+                for item in cart_items
+            ])
+            try:
+                decrement_stock({item['product_id']: item['quantity'] for item in cart_items})
+            except DjangoValidationError as error:
+                # Only reachable where SELECT .. FOR UPDATE is a no-op (SQLite)
+                raise serializers.ValidationError({"stock": error.messages})
+
+            # Clear the cart after creating order
+            cart.clear()
+            if cart_store.enabled():
+                # Only what was ordered leaves the Redis cart; later additions stay
+                if flushed is None:
+                    flushed = {
+                        str(item['product_id']): (item['quantity'], item['date_added'].timestamp()) for item in cart_items
+                    }
+                transaction.on_commit(lambda: cart_store.forget_cart(user.pk, flushed))
+
+        # bulk_create skips the OrderItem signals, so count the trending events here
+        for item in cart_items:
+            on_commit_record([item['product_id']], 'order', item['quantity'])
         return order
 
 
@@ -168,6 +227,11 @@ class OrderStatusUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['status']
+
+    def validate_status(self, value):
+        if self.instance is not None and not self.instance.can_transition_to(value):
+            raise serializers.ValidationError(f"Order status cannot change from {self.instance.status} to {value}.")
+        return value
         
         
 class ProductReviewSerializer(serializers.ModelSerializer):
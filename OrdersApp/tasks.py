@@ -0,0 +1,11 @@
+# app_name/tasks.py
+from celery import shared_task
+from . import cart_store
+
+
+@shared_task
+def flush_cart_store():
+    # Write-behind for CART_STORE = 'redis': persist the carts changed since the last pass
+    if not cart_store.enabled():
+        return 0
+    return cart_store.flush_dirty_carts()
@@ -1,3 +1,405 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ProductsApp.models import Products
+from ProductsApp.cache import product_cache_key
+from ProductsApp.trending import flush_events
+from OrdersApp import cart_store
+from OrdersApp.tasks import flush_cart_store
+from OrdersApp.models import (
+    Cart, CartItem, Order, OrderItem, OrderRestock, OrderStatusConflict, decrement_stock, restock_order,
+)
 
-# Create your tests here.
+
+class OrderItemIndexTests(TestCase):
+
+    def test_orders_of_a_product_use_the_product_order_index(self):
+        user = User.objects.create_user(username='buyer', password='testpassword')
+        product = Products.objects.create(name='Cable', brand='Anker', category='Computer', price=Decimal('9.00'),
+                                          description='cable', stock=10, user=user)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        plan = OrderItem.objects.filter(product=product).values('order_id').explain()
+        self.assertIn('orderitem_product_order_idx', plan, plan)
+
+
+class CheckoutTests(APITestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.user = User.objects.create_user(username='buyer', password='testpassword')
+        self.products = [
+            Products.objects.create(name=f'Item {i}', brand='Anker', category='Computer', price=Decimal('10.00') * (i + 1),
+                                    description='item', stock=5, user=vendor)
+            for i in range(4)
+        ]
+        self.client.force_authenticate(self.user)
+        self.url = '/api/orders/orders/create/'
+
+    def fill_cart(self, count, quantity=2):
+        for product in self.products[:count]:
+            CartItem.objects.create(cart=self.user.cart, product=product, quantity=quantity)
+
+    def test_checkout_moves_the_cart_into_the_order_and_takes_stock(self):
+        self.fill_cart(3)
+        response = self.client.post(self.url, {'payment_method': 'COD'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_amount, Decimal('120.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual([p.stock for p in Products.objects.filter(pk__in=[p.pk for p in self.products]).order_by('price')],
+                         [3, 3, 3, 5])
+        self.assertFalse(self.user.cart.items.exists())
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        counts = []
+        for size in (1, 4):
+            self.fill_cart(size, quantity=1)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.url, {'payment_method': 'COD'}, format='json')
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_insufficient_stock_rejects_the_whole_order(self):
+        self.fill_cart(2)
+        Products.objects.filter(pk=self.products[1].pk).update(stock=1)
+        response = self.client.post(self.url, {'payment_method': 'COD'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(self.products[1].pk), response.data['stock'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Products.objects.get(pk=self.products[0].pk).stock, 5)
+        self.assertEqual(self.user.cart.items.count(), 2)
+
+    def test_conditional_decrement_is_all_or_nothing(self):
+        with self.assertRaises(ValidationError):
+            decrement_stock({self.products[0].pk: 2, self.products[1].pk: 6})
+        self.assertEqual([p.stock for p in Products.objects.filter(pk__in=[self.products[0].pk, self.products[1].pk])], [5, 5])
+
+    def test_cached_products_are_dropped_after_commit(self):
+        key = product_cache_key(self.products[0].pk)
+        cache.set(key, {'stock': 5})
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock({self.products[0].pk: 2})
+            # Still inside the transaction: a reader re-caching now would only see the old stock
+            self.assertEqual(cache.get(key), {'stock': 5})
+        self.assertIsNone(cache.get(key))
+
+
+class CancellationRestockTests(TestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.products = [
+            Products.objects.create(name=f'Item {i}', brand='Anker', category='Computer', price=Decimal('10.00'),
+                                    description='item', stock=5, user=vendor)
+            for i in range(3)
+        ]
+        self.order = Order.objects.create(user=vendor)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=self.order, product=product, product_name=product.name, quantity=2, price=product.price)
+            for product in self.products
+        ])
+
+    def stock(self):
+        return [p.stock for p in Products.objects.filter(pk__in=[p.pk for p in self.products]).order_by('name')]
+
+    def test_items_go_back_once_on_the_transition(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'Cancelled'
+        order.save()
+        self.assertEqual(self.stock(), [7, 7, 7])
+        order.payment_status = 'Refunded'
+        order.save()
+        Order.objects.get(pk=order.pk).save()
+        self.assertEqual(self.stock(), [7, 7, 7])
+
+    def test_ledger_blocks_a_second_restock(self):
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertTrue(restock_order(order))
+        self.assertFalse(restock_order(order))
+        # A copy that never saw the cancelled status still restocks only once
+        stale = Order.objects.only('id').get(pk=order.pk)
+        stale.status = 'Cancelled'
+        stale.save()
+        self.assertEqual(self.stock(), [7, 7, 7])
+        self.assertTrue(OrderRestock.objects.filter(order=order).exists())
+
+    def test_cached_products_are_dropped_after_commit(self):
+        key = product_cache_key(self.products[0].pk)
+        cache.set(key, {'stock': 5})
+        with self.captureOnCommitCallbacks(execute=True):
+            restock_order(self.order)
+            self.assertEqual(cache.get(key), {'stock': 5})
+        self.assertIsNone(cache.get(key))
+
+
+class OrderStateMachineTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='testpassword')
+        self.order = Order.objects.create(user=self.user)
+
+    def test_valid_path_records_history_and_stamps_delivery(self):
+        order = Order.objects.get(pk=self.order.pk)
+        for step in ('Processing', 'Shipped', 'Delivered'):
+            order.status = step
+            order.save()
+        self.assertIsNotNone(Order.objects.get(pk=order.pk).delivered_at)
+        history = list(order.status_history.order_by('changed_at', 'id').values_list('from_status', 'to_status'))
+        self.assertEqual(history, [('', 'Pending'), ('Pending', 'Processing'), ('Processing', 'Shipped'), ('Shipped', 'Delivered')])
+
+    def test_saving_a_loaded_order_needs_no_extra_select(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.payment_status = 'Paid'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT')])
+
+    def test_invalid_transitions_are_rejected(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'Delivered'
+        with self.assertRaises(ValidationError):
+            order.save()
+        self.client.force_authenticate(self.user)
+        url = f'/api/orders/order/{self.order.pk}/status/'
+        response = self.client.patch(url, {'status': 'Shipped'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url, {'status': 'Cancelled'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'Cancelled')
+
+    def test_stale_instance_cannot_overwrite_a_newer_status(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        current = Order.objects.get(pk=self.order.pk)
+        current.status = 'Cancelled'
+        current.save()
+        stale.status = 'Processing'
+        with self.assertRaises(OrderStatusConflict), transaction.atomic():
+            stale.save()
+        stale = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(stale.status, 'Cancelled')
+        self.assertFalse(stale.status_history.filter(to_status='Processing').exists())
+        # Saves that leave the status alone still go through
+        current.payment_status = 'Refunded'
+        current.save()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).payment_status, 'Refunded')
+
+    def test_model_validation_errors_are_client_errors(self):
+        Order.objects.filter(pk=self.order.pk).update(status='Delivered')
+        self.client.force_authenticate(self.user)
+        with mock.patch.object(Order, 'can_cancel', return_value=True):
+            response = self.client.post(f'/api/orders/orders/{self.order.pk}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Delivered', response.data['error'])
+
+
+class CartRenderingTests(APITestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.user = User.objects.create_user(username='buyer', password='testpassword')
+        self.products = [
+            Products.objects.create(name=f'Item {i}', brand='Anker', category='Computer', price=Decimal('2.50'),
+                                    description='item', stock=9, user=vendor)
+            for i in range(4)
+        ]
+        self.client.force_authenticate(self.user)
+
+    def test_cart_renders_in_constant_queries(self):
+        counts = []
+        for product in self.products:
+            CartItem.objects.create(cart=self.user.cart, product=product, quantity=2)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/orders/cart/')
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertEqual(response.data['total_items'], 8)
+        self.assertEqual(response.data['total_price'], Decimal('20.00'))
+
+    def test_totals_without_prefetch_use_one_aggregate(self):
+        for product in self.products[:2]:
+            CartItem.objects.create(cart=self.user.cart, product=product, quantity=3)
+        cart = Cart.objects.get(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(cart.get_total_price(), Decimal('15.00'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(cart.get_total_items(), 6)
+
+    def test_mutations_return_the_full_cart(self):
+        response = self.client.post('/api/orders/cart/items/', {'product_id': str(self.products[0].pk), 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        response = self.client.patch(f'/api/orders/cart/items/{self.products[0].pk}/', {'quantity': 4}, format='json')
+        self.assertEqual(response.data['total_price'], Decimal('10.00'))
+        response = self.client.delete(f'/api/orders/cart/items/{self.products[0].pk}/')
+        self.assertEqual((response.data['items'], response.data['total_items']), ([], 0))
+
+
+class InMemoryRedis:
+    """The few hash/set commands the cart store uses, with redis-py's bytes replies."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def hgetall(self, key):
+        return {field.encode(): str(value).encode() for field, value in self.data.get(key, {}).items()}
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hsetnx(self, key, field, value):
+        self.data.setdefault(key, {}).setdefault(field, value)
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(key, {}).pop(field, None)
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(str(member) for member in members)
+
+    def srem(self, key, member):
+        self.data.get(key, set()).discard(str(member))
+
+    def spop(self, key, count):
+        members = self.data.get(key, set())
+        return [members.pop().encode() for _ in range(min(count, len(members)))]
+
+
+class InMemoryPipeline:
+    """
+    Queues commands and replays them on execute(), like a redis-py pipeline.
+    Between watch() and multi() commands run at once, as in redis-py.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+        self.watching = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.calls, self.watching = [], False
+
+    def watch(self, *keys):
+        self.watching = True
+
+    def multi(self):
+        self.watching = False
+
+    def __getattr__(self, name):
+        if self.watching:
+            return getattr(self.client, name)
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        return [getattr(self.client, name)(*args) for name, args in calls]
+
+
+@override_settings(CART_STORE='redis')
+class RedisCartStoreTests(APITestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.user = User.objects.create_user(username='buyer', password='testpassword')
+        self.products = [
+            Products.objects.create(name=f'Item {i}', brand='Anker', category='Computer', price=Decimal('4.00'),
+                                    description='item', stock=5, user=vendor)
+            for i in range(3)
+        ]
+        self.redis = InMemoryRedis()
+        patcher = mock.patch.object(cart_store, 'get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(self.user)
+
+    def add(self, product, quantity):
+        return self.client.post('/api/orders/cart/items/', {'product_id': str(product.pk), 'quantity': quantity}, format='json')
+
+    def test_changes_stay_in_redis_until_the_flush(self):
+        CartItem.objects.create(cart=self.user.cart, product=self.products[0], quantity=1)
+        self.add(self.products[1], 2)
+        response = self.client.patch(f'/api/orders/cart/items/{self.products[0].pk}/', {'quantity': 3}, format='json')
+        self.assertEqual(response.data['total_items'], 5)
+        self.assertEqual(list(CartItem.objects.values_list('quantity', flat=True)), [1])
+        self.client.delete(f'/api/orders/cart/items/{self.products[0].pk}/')
+        self.add(self.products[2], 4)
+        self.assertEqual(cart_store.flush_dirty_carts(), 1)
+        self.assertEqual(
+            dict(CartItem.objects.values_list('product_id', 'quantity')),
+            {self.products[1].pk: 2, self.products[2].pk: 4},
+        )
+        self.assertEqual(cart_store.flush_dirty_carts(), 0)
+
+    def test_flush_cost_does_not_grow_with_the_batch(self):
+        counts = []
+        for size in (1, 3):
+            users = [User.objects.create_user(username=f'batch{size}-{i}', password='testpassword') for i in range(size)]
+            for user in users:
+                cart_store.set_item(user.pk, self.products[0].pk, 1)
+                cart_store.set_item(user.pk, self.products[1].pk, 2)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(cart_store.flush_dirty_carts(), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(CartItem.objects.count(), 8)
+
+    def test_users_without_a_cart_row_are_dropped(self):
+        cart_store.set_item(self.user.pk, self.products[0].pk, 1)
+        Cart.objects.filter(user=self.user).delete()
+        with self.assertLogs('OrdersApp.cart_store', 'WARNING'):
+            self.assertEqual(cart_store.flush_dirty_carts(), 0)
+        self.assertEqual(self.redis.data[cart_store.DIRTY_KEY], set())
+
+    def test_stock_and_missing_items_are_still_checked(self):
+        self.assertEqual(self.add(self.products[0], 9).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f'/api/orders/cart/items/{self.products[0].pk}/', {'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.add(self.products[0], 1)
+        response = self.client.patch(f'/api/orders/cart/items/{self.products[0].pk}/', {'quantity': 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checkout_flushes_the_cart_first(self):
+        self.add(self.products[0], 2)
+        self.add(self.products[1], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/orders/create/', {'payment_method': 'COD'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('12.00'))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.client.get('/api/orders/cart/').data['items'], [])
+        flush_events()
+
+    def test_items_added_during_checkout_are_kept(self):
+        self.add(self.products[0], 2)
+        ordered = cart_store.flush_cart(self.user.pk)
+        # Lands after checkout read the cart but before its on_commit callback
+        self.add(self.products[1], 1)
+        cart_store.forget_cart(self.user.pk, ordered)
+        self.assertEqual(list(cart_store.load_entries(self.user.pk)), [str(self.products[1].pk)])
+        self.assertIn(str(self.user.pk), self.redis.data[cart_store.DIRTY_KEY])
+        flush_events()
+
+    def test_flush_task(self):
+        self.add(self.products[0], 2)
+        self.assertEqual(flush_cart_store.apply().get(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        flush_events()
@@ -6,9 +6,11 @@ from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import Prefetch
 
 from ProductsApp.models import Products, Reviews
 from .models import Cart, CartItem, Order, OrderItem
+from . import cart_store
 from .serializers import (
     CartSerializer, CartItemSerializer, 
     OrderSerializer, OrderCreateSerializer, OrderStatusUpdateSerializer,
@@ -19,18 +21,26 @@ from .serializers import (
 # Cart Management API Views
 # --------------------------
 
+def get_cart(user):
+    """The user's cart with items and products loaded for CartSerializer"""
+    if cart_store.enabled():
+        return cart_store.get_cart(user)
+    return CartSerializer.setup_eager_loading(Cart.objects.filter(user=user)).get()
+
 class CartView(APIView):
     """View for retrieving and managing the user's shopping cart"""
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         """Get the current user's cart with all items"""
-        cart = request.user.cart
-        serializer = CartSerializer(cart)
+        serializer = CartSerializer(get_cart(request.user))
         return Response(serializer.data)
     
     def delete(self, request):
         """Clear all items from the cart"""
+        if cart_store.enabled():
+            cart_store.clear_cart(request.user.pk)
+            return Response({"message": "Cart cleared successfully"}, status=status.HTTP_200_OK)
         cart = request.user.cart
         cart.clear()
         return Response({"message": "Cart cleared successfully"}, status=status.HTTP_200_OK)
@@ -50,17 +60,17 @@ class CartItemView(APIView):
         if serializer.is_valid():
             serializer.save()
             # Return the updated cart
-            cart_serializer = CartSerializer(request.user.cart)
+            cart_serializer = CartSerializer(get_cart(request.user))
             return Response(cart_serializer.data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def patch(self, request, product_id):
         """Update the quantity of an item in the cart"""
-        cart = request.user.cart
-        
+        if cart_store.enabled():
+            return self.patch_stored(request, product_id)
         try:
-            cart_item = CartItem.objects.get(cart=cart, product__id=product_id)
+            cart_item = CartItem.objects.select_related('product').get(cart__user=request.user, product__id=product_id)
             new_quantity = request.data.get('quantity', 0)
             
             if new_quantity <= 0:
@@ -79,7 +89,7 @@ class CartItemView(APIView):
             cart_item.save()
             
             # Return the updated cart
-            cart_serializer = CartSerializer(cart)
+            cart_serializer = CartSerializer(get_cart(request.user))
             return Response(cart_serializer.data, status=status.HTTP_200_OK)
         except CartItem.DoesNotExist:
             return Response(
@@ -89,14 +99,19 @@ class CartItemView(APIView):
     
     def delete(self, request, product_id):
         """Remove an item from the cart"""
-        cart = request.user.cart
-        
+        if cart_store.enabled():
+            if not cart_store.remove_item(request.user.pk, product_id):
+                return Response(
+                    {"error": "Product not found in cart"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response(CartSerializer(get_cart(request.user)).data, status=status.HTTP_200_OK)
         try:
-            cart_item = CartItem.objects.get(cart=cart, product__id=product_id)
+            cart_item = CartItem.objects.get(cart__user=request.user, product__id=product_id)
             cart_item.delete()
             
             # Return the updated cart
-            cart_serializer = CartSerializer(cart)
+            cart_serializer = CartSerializer(get_cart(request.user))
             return Response(cart_serializer.data, status=status.HTTP_200_OK)
         except CartItem.DoesNotExist:
             return Response(
@@ -104,6 +119,29 @@ class CartItemView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    
+    def patch_stored(self, request, product_id):
+        """PATCH against the Redis cart store (CART_STORE = 'redis')"""
+        if cart_store.get_quantity(request.user.pk, product_id) is None:
+            return Response(
+                {"error": "Product not found in cart"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        new_quantity = request.data.get('quantity', 0)
+        if new_quantity <= 0:
+            return Response(
+                {"error": "Quantity must be greater than zero"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        product = Products.objects.only('id', 'stock').filter(pk=product_id).first()
+        if product is None or new_quantity > product.stock:
+            return Response(
+                {"error": "Quantity exceeds available stock"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        cart_store.set_item(request.user.pk, product_id, new_quantity)
+        return Response(CartSerializer(get_cart(request.user)).data, status=status.HTTP_200_OK)
+
 
 # --------------------------
 # Order Management API Views
@@ -149,6 +187,10 @@ class CreateOrderView(APIView):
         
         if serializer.is_valid():
             order = serializer.save()
+            # Items were bulk inserted; load them back with their products in one query
+            order = Order.objects.prefetch_related(
+                Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+            ).get(pk=order.pk)
             order_serializer = OrderSerializer(order)
             return Response(order_serializer.data, status=status.HTTP_201_CREATED)
         
@@ -221,8 +263,13 @@ class OrderStatusView(APIView):
         try:
             order = Order.objects.get(id=order_id, user=request.user)
             new_status = request.data.get("status")
-            if new_status not in dict(Order.STATUS_CHOICES):
+            if new_status not in dict(Order.ORDER_STATUS_CHOICES):
                 return Response({"error": "Invalid status."}, status=status.HTTP_400_BAD_REQUEST)
+            if not order.can_transition_to(new_status):
+                return Response(
+                    {"error": f"Order status cannot change from {order.status} to {new_status}."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
             order.status = new_status
             order.save()
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ProductsappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ProductsApp'
+
+    def ready(self):
+        # Connect the signal receivers that keep derived data in sync
+        from . import autocomplete, cache, images, search, similarity, trending  # noqa: F401
+        from utils import recommendations  # noqa: F401
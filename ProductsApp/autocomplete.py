@@ -0,0 +1,165 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Products
+from .cache import get_catalog_version
+
+
+AUTOCOMPLETE_REFRESH_SECONDS = getattr(settings, 'PRODUCT_AUTOCOMPLETE_REFRESH_SECONDS', 300)
+
+
+def index_terms(name, brand):
+    # The full name, every word of the name and the brand are all valid prefixes
+    name = name.lower().strip()
+    terms = {name, brand.lower().strip()}
+    terms.update(re.findall(r'\w+', name))
+    terms.discard('')
+    return terms
+
+
+def popularity(product, default=0):
+    # review_count may still hold an F() expression right after a save
+    score = product.review_count
+    return score if isinstance(score, int) else default
+
+
+class PrefixIndex:
+    """
+    Sorted array of (term, product id) pairs searched with bisect. A prefix
+    lookup bisects both ends of the matching slice and keeps the most
+    popular products of the whole slice with a bounded heap. Results for
+    one and two letter prefixes, whose slices are the largest, are memoized
+    until the next change.
+    """
+
+    def __init__(self, rows=()):
+        self.lock = threading.Lock()
+        self.keys = []
+        self.entries = {}
+        self.short_prefixes = {}
+        self.version = None
+        self.checked_at = time.monotonic()
+        for pk, name, brand, score in rows:
+            self.entries[pk] = (name, brand, score)
+            self.keys.extend((term, pk) for term in index_terms(name, brand))
+        self.keys.sort()
+
+    def suggest(self, prefix, limit=10):
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        memoize = len(prefix) <= 2
+        size = max(limit, 10)
+        memoized = self.short_prefixes.get(prefix) if memoize else None
+        if memoized is not None and memoized[0] >= size:
+            return memoized[1][:limit]
+        with self.lock:
+            start = bisect_left(self.keys, (prefix,))
+            end = bisect_left(self.keys, (prefix + '\uffff',), start)
+            found = {pk for _, pk in self.keys[start:end]}
+            ranked = heapq.nsmallest(size, found, key=lambda pk: (-self.entries[pk][2], self.entries[pk][0]))
+            suggestions = [
+                {'id': pk, 'name': self.entries[pk][0], 'brand': self.entries[pk][1]}
+                for pk in ranked
+            ]
+            if memoize:
+                self.short_prefixes[prefix] = (size, suggestions)
+        return suggestions[:limit]
+
+    def upsert(self, pk, name, brand, score):
+        with self.lock:
+            self._remove(pk)
+            self.entries[pk] = (name, brand, score)
+            for term in index_terms(name, brand):
+                insort(self.keys, (term, pk))
+            self.short_prefixes.clear()
+
+    def remove(self, pk):
+        with self.lock:
+            self._remove(pk)
+            self.short_prefixes.clear()
+
+    def _remove(self, pk):
+        entry = self.entries.pop(pk, None)
+        if entry is None:
+            return
+        for term in index_terms(entry[0], entry[1]):
+            position = bisect_left(self.keys, (term, pk))
+            if position < len(self.keys) and self.keys[position] == (term, pk):
+                del self.keys[position]
+
+
+_index = None
+_rebuilding = threading.Lock()
+
+
+def build_index():
+    version = get_catalog_version()
+    rows = Products.objects.values_list('id', 'name', 'brand', 'review_count').iterator(chunk_size=5000)
+    index = PrefixIndex((pk, name, brand, score or 0) for pk, name, brand, score in rows)
+    index.version = version
+    return index
+
+
+def _rebuild_in_background():
+    global _index
+    try:
+        _index = build_index()
+    finally:
+        # This thread's connection would otherwise stay open until the process exits
+        connection.close()
+        _rebuilding.release()
+
+
+def get_index():
+    """
+    The process-wide index, built on first use. Changes made in this process
+    are patched in by the receivers below. Changes made by other workers are
+    picked up by a background rebuild once the shared catalog version moves,
+    checked at most every PRODUCT_AUTOCOMPLETE_REFRESH_SECONDS; the old
+    index keeps answering meanwhile.
+    """
+    global _index
+    index = _index
+    if index is None:
+        with _rebuilding:
+            if _index is None:
+                _index = build_index()
+        return _index
+    now = time.monotonic()
+    if now - index.checked_at >= AUTOCOMPLETE_REFRESH_SECONDS:
+        index.checked_at = now
+        if get_catalog_version() != index.version and _rebuilding.acquire(blocking=False):
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    return index
+
+
+def refresh_autocomplete(products):
+    # For bulk writers, which bypass the receivers below
+    if _index is not None:
+        for product in products:
+            _index.upsert(product.pk, product.name, product.brand, popularity(product))
+
+
+def reset_index():
+    global _index
+    _index = None
+
+
+@receiver(post_save, sender=Products)
+def patch_autocomplete_index(sender, instance, raw=False, **kwargs):
+    if _index is not None and not raw:
+        previous = _index.entries.get(instance.pk, (None, None, 0))[2]
+        _index.upsert(instance.pk, instance.name, instance.brand, popularity(instance, previous))
+
+
+@receiver(post_delete, sender=Products)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    if _index is not None:
+        _index.remove(instance.pk)
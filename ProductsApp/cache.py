@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from utils.cache_stats import record_cache_stat
+from .models import Products, Reviews
+
+
+PRODUCT_CACHE_TIMEOUT = getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 60 * 60)
+PRODUCT_CACHE_STATS = 'product_detail'
+CATALOG_VERSION_KEY = 'products:catalog_version'
+
+
+def product_cache_key(pk):
+    # Same key for every spelling of the UUID (dashes, case)
+    return f"products:detail:{str(pk).replace('-', '').lower()}"
+
+
+def get_product_payload(pk, load):
+    """
+    Return the serialized product `pk`, calling `load()` to build it only on
+    a cache miss. Entries live until the product or one of its reviews
+    changes (see the receivers below), the timeout is just a safety net.
+    """
+    key = product_cache_key(pk)
+    payload = cache.get(key)
+    record_cache_stat(PRODUCT_CACHE_STATS, hit=payload is not None)
+    if payload is None:
+        payload = load()
+        cache.set(key, payload, PRODUCT_CACHE_TIMEOUT)
+    return payload
+
+
+def invalidate_products(ids):
+    cache.delete_many([product_cache_key(pk) for pk in ids])
+    bump_catalog_version()
+
+
+def get_catalog_version():
+    """
+    Time (in microseconds) of the last change to any product or review. It
+    doubles as the catalog ETag and Last-Modified, so a conditional GET is
+    answered from one cache lookup. After a cache flush it restarts at "now",
+    which only costs clients one full download.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1_000_000)
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, int(time.time() * 1_000_000), timeout=None)
+
+
+def catalog_etag(request, *args, **kwargs):
+    return str(get_catalog_version())
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(get_catalog_version() // 1_000_000, tz=timezone.utc)
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def invalidate_product_cache(sender, instance, **kwargs):
+    invalidate_products([instance.pk])
+
+
+@receiver(post_save, sender=Reviews)
+@receiver(post_delete, sender=Reviews)
+def invalidate_reviewed_product_cache(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
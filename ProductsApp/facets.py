@@ -0,0 +1,67 @@
+import hashlib
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F
+from django.db.models.functions import Floor
+from .filters import ProductFilters
+from .cache import get_catalog_version
+
+
+PRICE_BUCKET_SIZE = getattr(settings, 'PRODUCT_FACETS_PRICE_BUCKET_SIZE', 100)
+FACETS_CACHE_TIMEOUT = getattr(settings, 'PRODUCT_FACETS_CACHE_TIMEOUT', 300)
+
+
+def facets_cache_key(params):
+    # Only real filter params count, and `?Brand= Dell` equals `?brand=dell`
+    items = sorted(
+        (name, params.get(name).strip().lower())
+        for name in ProductFilters.base_filters
+        if params.get(name, '').strip()
+    )
+    digest = hashlib.md5(repr(items).encode('utf-8')).hexdigest()
+    # Keyed on the catalog version, so any product or review change starts fresh
+    return f'products:facets:{get_catalog_version()}:{digest}'
+
+
+def compute_facets(queryset):
+    """
+    Count products per category, brand, price bucket and whole-star rating
+    with a single GROUP BY over all four dimensions, then roll the groups up
+    in Python. The number of groups is bounded by the facet values, not by
+    the number of products.
+    """
+    groups = (
+        queryset.order_by()
+        .annotate(price_bucket=Floor(F('price') / PRICE_BUCKET_SIZE), rating_bucket=Floor('rating'))
+        .values('category', 'brand', 'price_bucket', 'rating_bucket')
+        .annotate(count=Count('pk'))
+    )
+    categories, brands, prices, ratings = Counter(), Counter(), Counter(), Counter()
+    total = 0
+    for group in groups:
+        count = group['count']
+        total += count
+        categories[group['category']] += count
+        brands[group['brand']] += count
+        prices[int(group['price_bucket'])] += count
+        ratings[int(group['rating_bucket'])] += count
+    return {
+        'total': total,
+        'categories': [{'value': value, 'count': count} for value, count in categories.most_common()],
+        'brands': [{'value': value, 'count': count} for value, count in brands.most_common()],
+        'price_buckets': [
+            {'min': bucket * PRICE_BUCKET_SIZE, 'max': (bucket + 1) * PRICE_BUCKET_SIZE, 'count': prices[bucket]}
+            for bucket in sorted(prices)
+        ],
+        'ratings': [{'rating': stars, 'count': ratings[stars]} for stars in range(6)],
+    }
+
+
+def get_facets(params, queryset):
+    key = facets_cache_key(params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(ProductFilters(params, queryset).qs)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
@@ -1,14 +1,23 @@
 import django_filters
+from django.db.models.functions import Lower
 from .models import Products
+from .search import get_search_backend
 
 class ProductFilters(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='iexact')
-    keyword = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
+    keyword = django_filters.CharFilter(method='filter_keyword')  # ranked full-text search
     min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
-    category = django_filters.CharFilter(field_name='category__name', lookup_expr='icontains')
-    brand = django_filters.CharFilter(field_name='brand__name', lookup_expr='icontains')
+    # Case-insensitive, compared as LOWER(column) = value so the Lower() indexes can be used
+    category = django_filters.CharFilter(field_name='category', method='filter_lower_exact')
+    brand = django_filters.CharFilter(field_name='brand', method='filter_lower_exact')
 
     class Meta:
         model = Products
-        fields = ['category', 'brand', 'user', 'keyword', 'min_price', 'max_price']
\ No newline at end of file
+        fields = ['category', 'brand', 'user', 'keyword', 'min_price', 'max_price']
+
+    def filter_keyword(self, queryset, name, value):
+        return get_search_backend().search(queryset, value)
+
+    def filter_lower_exact(self, queryset, name, value):
+        return queryset.alias(**{f'{name}_lower': Lower(name)}).filter(**{f'{name}_lower': value.lower()})
@@ -0,0 +1,94 @@
+import logging
+import posixpath
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Products
+
+logger = logging.getLogger(__name__)
+
+# field -> (bounding box, Pillow format, extension)
+DERIVATIVES = {
+    'image_thumbnail': ((200, 200), 'JPEG', 'jpg'),
+    'image_medium': ((800, 800), 'JPEG', 'jpg'),
+    'image_webp': ((800, 800), 'WEBP', 'webp'),
+}
+
+
+def derivative_name(original, field):
+    folder, filename = posixpath.split(original)
+    stem = posixpath.splitext(filename)[0]
+    suffix = field.replace('image_', '')
+    return posixpath.join(folder, 'derivatives', f'{stem}_{suffix}.{DERIVATIVES[field][2]}')
+
+
+def build_derivatives(product):
+    """Write every derivative of `product.image` to storage and return {field: name}."""
+    from PIL import Image, ImageOps
+    with product.image.open('rb') as handle:
+        original = Image.open(handle)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    names = {}
+    for field, (size, image_format, _) in DERIVATIVES.items():
+        image = original.copy()
+        image.thumbnail(size)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, format=image_format, quality=82, optimize=True)
+        name = derivative_name(product.image.name, field)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        names[field] = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return names
+
+
+def schedule_derivatives(product_id):
+    from .tasks import generate_image_derivatives
+    try:
+        generate_image_derivatives.delay(str(product_id))
+    except Exception:
+        # The upload itself succeeded; listings fall back to the original image
+        logger.exception('Could not queue image derivatives for product %s', product_id)
+
+
+def delete_derivatives(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception:
+            logger.exception('Could not delete image derivative %s', name)
+
+
+@receiver(post_save, sender=Products)
+def queue_image_derivatives(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_image', None)
+    if previous is DEFERRED:
+        if 'image' not in instance.__dict__:
+            # Loaded without the image and never assigned one
+            return
+        previous = None
+    previous = getattr(previous, 'name', previous) or None
+    current = instance.image.name if instance.image else None
+    if not created and current == previous:
+        return
+    instance._loaded_image = current
+    if not created:
+        # The derivatives of the replaced image are stale; the task writes new ones
+        stored = Products.objects.filter(pk=instance.pk).values_list(*DERIVATIVES).first() or ()
+        stale = [name for name in stored if name]
+        if stale:
+            Products.objects.filter(pk=instance.pk).update(**{field: None for field in DERIVATIVES})
+            for field in DERIVATIVES:
+                setattr(instance, field, None)
+            transaction.on_commit(lambda: delete_derivatives(stale))
+    if current:
+        product_id = instance.pk
+        transaction.on_commit(lambda: schedule_derivatives(product_id))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from utils.cache_stats import get_cache_stats, reset_cache_stats
+from ProductsApp.cache import PRODUCT_CACHE_STATS
+from utils.recommendations import RECOMMENDATION_CACHE_STATS
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the application caches'
+
+    caches = [PRODUCT_CACHE_STATS, RECOMMENDATION_CACHE_STATS]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        for name in self.caches:
+            stats = get_cache_stats(name)
+            self.stdout.write(f"{name}: hits={stats['hits']} misses={stats['misses']} hit_ratio={stats['hit_ratio']}")
+            if options['reset']:
+                reset_cache_stats(name)
@@ -0,0 +1,210 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ProductsApp.models import Products, Categories
+from ProductsApp.cache import invalidate_products
+from ProductsApp.search import get_search_backend
+from ProductsApp.autocomplete import refresh_autocomplete
+from ProductsApp.similarity import schedule_similarity_update
+
+
+IMPORT_FIELDS = ['sku', 'name', 'description', 'price', 'brand', 'category', 'stock']
+UPDATE_FIELDS = ['name', 'description', 'price', 'brand', 'category', 'stock']
+
+# Header spellings seen in vendor files -> model field
+HEADER_ALIASES = {
+    'descriptin': 'description',
+    'product_name': 'name',
+    'quantity': 'stock',
+}
+
+
+# `?category=computer` style values -> the stored choice
+CATEGORY_VALUES = {value.lower(): value for value, _ in Categories.choices}
+
+
+def normalize_header(header):
+    name = str(header or '').strip().lower().replace(' ', '_')
+    return HEADER_ALIASES.get(name, name)
+
+
+def product_headers(values):
+    """
+    Normalized column names if `values` is the header of a products table,
+    else None. Sheets exported from the admin have no sku column; their own
+    `id` column is the vendor's product code and is used as the sku.
+    """
+    headers = [normalize_header(value) for value in values]
+    if 'name' not in headers:
+        return None
+    if 'sku' not in headers:
+        if 'id' not in headers:
+            return None
+        headers = ['sku' if header == 'id' else header for header in headers]
+    return headers
+
+
+def read_csv(path, header_row):
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.reader(handle)
+        yield from read_table(reader, header_row)
+
+
+def read_xlsx(path, header_row):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from read_table(workbook.active.iter_rows(values_only=True), header_row)
+    finally:
+        workbook.close()
+
+
+def read_table(rows, header_row):
+    """
+    Rows of the products table as (row number, {field: value}). Without a
+    header_row the first row that looks like a products header is used.
+    The table ends at the first blank row, so other tables further down
+    the same sheet (carts, orders...) are never read as products.
+    """
+    headers = None
+    for number, values in enumerate(rows, start=1):
+        if headers is None:
+            if header_row is not None:
+                if number == header_row:
+                    headers = product_headers(values) or [normalize_header(value) for value in values]
+            else:
+                headers = product_headers(values)
+            continue
+        if not any(value not in (None, '') for value in values):
+            return
+        yield number, dict(zip(headers, values))
+
+
+def read_ndjson(path, header_row):
+    with open(path, encoding='utf-8') as handle:
+        for number, line in enumerate(handle, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    row = {'__error__': f'invalid JSON: {error}'}
+                if not isinstance(row, dict):
+                    row = {'__error__': 'each line must be a JSON object'}
+                yield number, {normalize_header(key): value for key, value in row.items()}
+
+
+READERS = {'.csv': read_csv, '.xlsx': read_xlsx, '.ndjson': read_ndjson, '.jsonl': read_ndjson}
+
+
+class Command(BaseCommand):
+    help = 'Bulk upsert products from a CSV, XLSX or NDJSON file, matching existing products by sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import (.csv, .xlsx, .ndjson or .jsonl)')
+        parser.add_argument('--user', required=True, help='Username of the vendor that owns the imported products')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows validated and written per batch')
+        parser.add_argument('--header-row', type=int, help='Row holding the column names (CSV/XLSX); found automatically if omitted')
+        parser.add_argument('--rejects', help='Write rejected rows with their errors to this CSV file')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Unsupported file type: {path.suffix}')
+        if not path.exists():
+            raise CommandError(f'File not found: {path}')
+        try:
+            self.owner = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        self.search_backend = get_search_backend()
+        self.rejected = []
+        imported = 0
+        started = time.monotonic()
+
+        batch = []
+        for number, row in reader(path, options['header_row']):
+            batch.append((number, row))
+            if len(batch) >= options['batch_size']:
+                imported += self.import_batch(batch)
+                batch = []
+        if batch:
+            imported += self.import_batch(batch)
+
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else imported
+        if options['rejects'] and self.rejected:
+            self.write_rejects(options['rejects'])
+        for number, error in self.rejected[:20]:
+            self.stderr.write(f'row {number}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} product(s), rejected {len(self.rejected)} row(s) '
+            f'in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
+
+    def import_batch(self, batch):
+        products = {}
+        numbers = {}
+        for number, row in batch:
+            try:
+                product = self.build_product(row)
+            except ValidationError as error:
+                self.rejected.append((number, '; '.join(error.messages)))
+                continue
+            # The last row wins when a file repeats a sku
+            products[product.sku] = product
+            numbers[product.sku] = number
+        # The upsert matches on sku alone, so never let it touch another vendor's product
+        taken = Products.objects.filter(sku__in=list(products)).exclude(user=self.owner).values_list('sku', flat=True)
+        for sku in taken:
+            del products[sku]
+            self.rejected.append((numbers[sku], f'sku {sku} belongs to another vendor'))
+        if not products:
+            return 0
+
+        with transaction.atomic():
+            Products.objects.bulk_create(
+                products.values(),
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=UPDATE_FIELDS,
+            )
+        # bulk_create skips the model signals, so refresh the derived data here
+        saved = list(Products.objects.filter(sku__in=products).only('id', 'name', 'brand', 'description', 'review_count'))
+        self.search_backend.index_products(saved)
+        refresh_autocomplete(saved)
+        schedule_similarity_update([product.pk for product in saved])
+        invalidate_products([product.pk for product in saved])
+        return len(products)
+
+    def build_product(self, row):
+        if '__error__' in row:
+            raise ValidationError(row['__error__'])
+        values = {field: row.get(field) for field in IMPORT_FIELDS}
+        values['sku'] = str(values['sku'] or '').strip()
+        if not values['sku']:
+            raise ValidationError('sku is required')
+        for field in ('name', 'description', 'brand', 'category'):
+            values[field] = str(values[field] or '').strip()
+        values['category'] = CATEGORY_VALUES.get(values['category'].lower(), values['category'])
+        try:
+            values['price'] = Decimal(str(values['price'] or 0))
+            values['stock'] = int(values['stock'] or 0)
+        except (InvalidOperation, ValueError, TypeError):
+            raise ValidationError('price and stock must be numbers')
+        product = Products(user=self.owner, **values)
+        product.clean_fields(exclude=['id', 'user', 'image', 'rating', 'review_count', 'search_vector'])
+        return product
+
+    def write_rejects(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['row', 'error'])
+            writer.writerows(self.rejected)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from ProductsApp.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product keyword search index from the products table'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt with {type(backend).__name__}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from ProductsApp.models import reconcile_product_ratings
+from ProductsApp.cache import invalidate_products
+
+
+class Command(BaseCommand):
+    help = 'Recompute product rating aggregates that drifted from their reviews'
+
+    def handle(self, *args, **options):
+        fixed = reconcile_product_ratings()
+        if fixed:
+            invalidate_products(fixed)
+        self.stdout.write(self.style.SUCCESS(f'Fixed rating aggregates of {len(fixed)} product(s)'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from AccountsApp.models import reconcile_wishlist_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute product wishlist counters that drifted from the wishlists'
+
+    def handle(self, *args, **options):
+        fixed = reconcile_wishlist_counts()
+        self.stdout.write(self.style.SUCCESS(f'Fixed wishlist counts of {len(fixed)} product(s)'))
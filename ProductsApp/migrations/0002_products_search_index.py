@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:55
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+FTS_TABLE = 'ProductsApp_products_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5('
+            "product_id UNINDEXED, name, brand, description, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO "{FTS_TABLE}" (product_id, name, brand, description) '
+            'SELECT id, name, brand, description FROM "ProductsApp_products"'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'UPDATE "ProductsApp_products" SET search_vector = '
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(brand, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "products_search_vector_gin" '
+            'ON "ProductsApp_products" USING gin (search_vector)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS "products_search_vector_gin"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
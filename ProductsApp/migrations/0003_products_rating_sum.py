@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Products = apps.get_model('ProductsApp', 'Products')
+    Reviews = apps.get_model('ProductsApp', 'Reviews')
+    reviews = Reviews.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Products.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0002_products_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
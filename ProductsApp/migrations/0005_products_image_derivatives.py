@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0004_products_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='image_medium',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='image_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_star_counts(apps, schema_editor):
+    Products = apps.get_model('ProductsApp', 'Products')
+    Reviews = apps.get_model('ProductsApp', 'Reviews')
+    reviews = Reviews.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Products.objects.update(**{
+        f'star_{star}_count': Coalesce(
+            Subquery(reviews.annotate(total=Count('pk', filter=Q(rating=star))).values('total')), 0
+        )
+        for star in range(1, 6)
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0005_products_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='star_1_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='star_2_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='star_3_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='star_4_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='star_5_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_star_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0006_products_star_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'price', 'id'], name='products_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['brand', 'price', 'id'], name='products_brand_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['created_at', 'id'], name='products_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['price', 'id'], name='products_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['category', 'price'], name='products_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviews',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='reviews_product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviews',
+            index=models.Index(fields=['product', '-rating', '-created_at'], name='reviews_product_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0007_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ProductsApp.products')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='ProductsApp.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-score'], name='neighbour_product_score_idx')],
+                'unique_together': {('product', 'neighbour')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_wishlist_count(apps, schema_editor):
+    # The wishlist table is not in the AccountsApp migrations yet, so go through SQL
+    # when it exists; otherwise reconcile_wishlist_counts fills the column later
+    connection = schema_editor.connection
+    if 'AccountsApp_wishlist_products' not in connection.introspection.table_names():
+        return
+    products = schema_editor.quote_name('ProductsApp_products')
+    schema_editor.execute(
+        f'UPDATE {products} SET wishlist_count = ('
+        f'SELECT COUNT(*) FROM "AccountsApp_wishlist_products" w WHERE w.products_id = {products}.id)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0008_product_neighbours'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='wishlist_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['-wishlist_count', 'id'], name='products_wishlist_count_idx'),
+        ),
+        migrations.RunPython(backfill_wishlist_count, migrations.RunPython.noop),
+    ]
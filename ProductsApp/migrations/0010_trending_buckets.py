@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0009_products_wishlist_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('score', models.FloatField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_buckets', to='ProductsApp.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_start'], name='trending_bucket_start_idx')],
+                'unique_together': {('product', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:58
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0010_trending_buckets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='products',
+            name='products_category_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='products',
+            name='products_brand_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='products',
+            name='products_in_stock_idx',
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(django.db.models.functions.text.Lower('category'), models.F('price'), models.F('id'), name='products_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(django.db.models.functions.text.Lower('brand'), models.F('price'), models.F('id'), name='products_brand_price_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProductsApp', '0011_case_insensitive_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='products',
+            name='category',
+            field=models.CharField(choices=[('Computer', 'Computer'), ('Food', 'Food'), ('Kids', 'Kids'), ('Home', 'Home'), ('Mobile', 'Mobile')], max_length=50),
+        ),
+    ]
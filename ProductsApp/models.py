@@ -4,7 +4,9 @@ from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.db.models import Avg
+from django.db.models import DEFERRED, Avg, Count, Sum, F, Q, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Lower, NullIf, Round
+from django.contrib.postgres.search import SearchVectorField
 
 # Create your models here.
 class Categories(models.TextChoices):
@@ -12,6 +14,9 @@ class Categories(models.TextChoices):
     FOOD = 'Food'
     KIDS = 'Kids'
     HOME = 'Home'
+    MOBILE = 'Mobile'
+
+STAR_FIELDS = {star: f'star_{star}_count' for star in range(1, 6)}
 
 class Products(models.Model):
     id = models.UUIDField(
@@ -20,7 +25,12 @@ class Products(models.Model):
     editable=False
     )
     name = models.CharField(max_length=200, default='', blank=False)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # vendor stock keeping unit, used by imports
     image = models.ImageField(blank=True, null=True, upload_to='ProductsApp/images/%Y/%m/%d/')
+    # Resized copies of `image`, generated in the background by tasks.generate_image_derivatives
+    image_thumbnail = models.ImageField(blank=True, null=True, editable=False)
+    image_medium = models.ImageField(blank=True, null=True, editable=False)
+    image_webp = models.ImageField(blank=True, null=True, editable=False)
     description = models.TextField(max_length=1000, default='', blank=False)
     price = models.DecimalField(max_digits=7, decimal_places=2, null=False, default=0.00)
     brand = models.CharField(max_length=200, default='', blank=False)
@@ -30,8 +40,58 @@ class Products(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     review_count = models.IntegerField(default=0, blank=True, null=True)  # عدد المراجعات
+    rating_sum = models.IntegerField(default=0, editable=False)  # مجموع التقييمات، rating = rating_sum / review_count
+    # Number of reviews per star, kept in step with rating_sum by apply_review_delta
+    star_1_count = models.IntegerField(default=0, editable=False)
+    star_2_count = models.IntegerField(default=0, editable=False)
+    star_3_count = models.IntegerField(default=0, editable=False)
+    star_4_count = models.IntegerField(default=0, editable=False)
+    star_5_count = models.IntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)  # used by the PostgreSQL search backend only
+    wishlist_count = models.IntegerField(default=0, editable=False)  # kept by the Wishlist.products m2m_changed receiver
+    class Meta:
+        # Match the filter/sort combinations of ProductFilters and the catalog paginators
+        indexes = [
+            models.Index(Lower('category'), F('price'), F('id'), name='products_category_price_idx'),
+            models.Index(Lower('brand'), F('price'), F('id'), name='products_brand_price_idx'),
+            models.Index(fields=['created_at', 'id'], name='products_created_idx'),
+            models.Index(fields=['price', 'id'], name='products_price_idx'),
+            # "Most wishlisted" reads the first rows of this index
+            models.Index(fields=['-wishlist_count', 'id'], name='products_wishlist_count_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    def rating_histogram(self):
+        return {star: getattr(self, field) for star, field in STAR_FIELDS.items()}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so a save can tell whether it was replaced;
+        # DEFERRED when the query left it out
+        instance._loaded_image = instance.__dict__.get('image', DEFERRED)
+        # ... and the columns the similarity features are built from
+        instance._loaded_features = instance.feature_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Lazily loaded columns hold the stored values, not edits
+        if fields is None or 'image' in fields:
+            self._loaded_image = self.__dict__.get('image')
+        loaded = getattr(self, '_loaded_features', (None,) * len(self.FEATURE_FIELDS))
+        self._loaded_features = tuple(
+            self.__dict__.get(field) if fields is None or field in fields else value
+            for field, value in zip(self.FEATURE_FIELDS, loaded)
+        )
+
+    # Columns encoded by similarity.encode; deferred ones read as None
+    FEATURE_FIELDS = ('name', 'brand', 'category', 'price', 'rating')
+
+    def feature_values(self):
+        return tuple(self.__dict__.get(field) for field in self.FEATURE_FIELDS)
     
 class Reviews(models.Model):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='reviews')
@@ -45,24 +105,121 @@ class Reviews(models.Model):
 
     class Meta:
         unique_together = ('user', 'product')  # منع المراجعات المكررة
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id'], name='reviews_product_created_idx'),
+            models.Index(fields=['product', '-rating', '-created_at'], name='reviews_product_rating_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating so an edit only applies the difference
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+
+class ProductNeighbour(models.Model):
+    # Top-k co-purchased/co-wishlisted products, rebuilt offline by tasks.build_product_neighbours
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('product', 'neighbour')
+        indexes = [
+            models.Index(fields=['product', '-score'], name='neighbour_product_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.neighbour_id} ({self.score:.3f})"
+
+
+class TrendingBucket(models.Model):
+    # Hourly rollup of weighted product events, written in batches by trending.flush_events
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='trending_buckets')
+    bucket_start = models.DateTimeField()
+    score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'bucket_start')
+        indexes = [
+            models.Index(fields=['bucket_start'], name='trending_bucket_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.bucket_start:%Y-%m-%d %H:00} = {self.score}"
+
+
+def apply_review_delta(product_id, added=None, removed=None):
+    """
+    Move a product's rating aggregates for one review whose star rating went
+    from `removed` to `added` (either may be None for a create or a delete),
+    with a single UPDATE that touches only the aggregate columns. The
+    right-hand sides read the pre-update row, so the new average is computed
+    from the new totals.
+    """
+    rating_delta = (added or 0) - (removed or 0)
+    count_delta = (added is not None) - (removed is not None)
+    new_sum = F('rating_sum') + rating_delta
+    new_count = Coalesce(F('review_count'), 0) + count_delta
+    changes = {
+        'rating_sum': new_sum,
+        'review_count': new_count,
+        'rating': Coalesce(Round(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 2), Value(0.0)),
+    }
+    if added != removed:
+        if added is not None:
+            changes[STAR_FIELDS[added]] = F(STAR_FIELDS[added]) + 1
+        if removed is not None:
+            changes[STAR_FIELDS[removed]] = F(STAR_FIELDS[removed]) - 1
+    Products.objects.filter(pk=product_id).update(**changes)
+
+
+def reconcile_product_ratings(queryset=None):
+    """Recompute drifted rating aggregates from the reviews; returns the fixed product ids."""
+    if queryset is None:
+        queryset = Products.objects.all()
+    reviews = Reviews.objects.filter(product=OuterRef('pk')).order_by().values('product')
+
+    def total(aggregate):
+        return Coalesce(Subquery(reviews.annotate(total=aggregate).values('total')), 0)
+
+    actual = {
+        'rating_sum': total(Sum('rating')),
+        'review_count': total(Count('pk')),
+        **{field: total(Count('pk', filter=Q(rating=star))) for star, field in STAR_FIELDS.items()},
+    }
+    annotated = queryset.annotate(**{f'actual_{field}': value for field, value in actual.items()})
+    drifted = list(
+        annotated.exclude(**{field: F(f'actual_{field}') for field in actual}).values_list('pk', flat=True)
+    )
+    if drifted:
+        Products.objects.filter(pk__in=drifted).update(
+            rating=Coalesce(Round(Subquery(reviews.annotate(average=Avg('rating')).values('average')), 2), Value(0.0)),
+            **actual,
+        )
+    return drifted
+
+
 @receiver(post_save, sender=Reviews)
-@receiver(post_delete, sender=Reviews)
-def update_product_rating(sender, instance, **kwargs):
-    product = instance.product
-    reviews = product.reviews.all()
-    if reviews.exists():
-        product.rating = reviews.aggregate(avg_rating=Avg('rating'))['avg_rating']
+def add_review_to_product_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_rating', None)
+    if created:
+        apply_review_delta(instance.product_id, added=instance.rating)
+    elif previous is not None:
+        if instance.rating != previous:
+            apply_review_delta(instance.product_id, added=instance.rating, removed=previous)
     else:
-        product.rating = 0  # إذا لم تكن هناك مراجعات
-    product.save()
-    
-@receiver(post_save, sender=Reviews)
+        # Saved without being loaded first, so the previous rating is unknown
+        reconcile_product_ratings(Products.objects.filter(pk=instance.product_id))
+    instance._loaded_rating = instance.rating
+
+
 @receiver(post_delete, sender=Reviews)
-def update_review_count(sender, instance, **kwargs):
-    product = instance.product
-    product.review_count = product.reviews.count()
-    product.save()
\ No newline at end of file
+def remove_review_from_product_rating(sender, instance, **kwargs):
+    apply_review_delta(instance.product_id, removed=instance.rating)
@@ -0,0 +1,139 @@
+import base64
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CatalogPageNumberPagination(PageNumberPagination):
+    # Classic ?page=N pagination, kept for clients that need page numbers
+    page_size = 2
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over a stable, unique sort key.
+
+    Instead of OFFSET, every page continues from the last row of the previous
+    one with `WHERE (key, id) > (last_key, last_id)`, so deep pages cost the
+    same as the first page. The cursor is an opaque urlsafe token holding the
+    ordering and the last row's key values.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    skip_count_query_param = 'skip_count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # ordering name -> model fields, the last field must be unique
+    orderings = {
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+    default_ordering = '-created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        fields = self.orderings[self.ordering]
+
+        self.count = None
+        if not self.get_skip_count(request):
+            self.count = queryset.count()
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(fields, position))
+
+        results = list(queryset.order_by(*fields)[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        payload = {}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering not in self.orderings:
+            return self.default_ordering
+        return ordering
+
+    def get_skip_count(self, request):
+        return request.query_params.get(self.skip_count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_seek_filter(self, fields, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        seek = Q()
+        equal = {}
+        for field, value in zip(fields, position):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            seek |= Q(**equal, **{name + lookup: value})
+            equal[name] = value
+        return seek
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            fields = self.orderings[data['o']]
+            if data['o'] != self.ordering or len(data['v']) != len(fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(fields, data['v'])
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        fields = self.orderings[self.ordering]
+        values = [str(getattr(obj, field.lstrip('-'))) for field in fields]
+        data = json.dumps({'o': self.ordering, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+
+class ReviewKeysetPagination(KeysetPagination):
+    # The product already knows its review count, so never COUNT(*) the reviews
+    page_size = 10
+    max_page_size = 50
+    orderings = {
+        '-created_at': ('-created_at', '-id'),
+        '-rating': ('-rating', '-created_at', '-id'),
+        'rating': ('rating', '-created_at', '-id'),
+    }
+    default_ordering = '-created_at'
+
+    def get_skip_count(self, request):
+        return True
@@ -0,0 +1,159 @@
+import re
+import uuid
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, When, Q, FloatField, IntegerField, F
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from .models import Products
+
+
+FTS_TABLE = 'ProductsApp_products_fts'
+
+# Field -> weight, higher weight means a match counts more in the ranking
+SEARCH_FIELDS = (('name', 10.0), ('brand', 5.0), ('description', 1.0))
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class BaseSearchBackend:
+    """
+    Keyword search over products. `search` narrows a queryset to the products
+    matching every term (the last term as a prefix, for search-as-you-type)
+    and orders it by relevance. The index hooks are called by the product
+    signals below and by bulk writers that bypass signals.
+    """
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def order_by_ids(self, queryset, ids):
+        if not ids:
+            return queryset.none()
+        ranking = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(pk__in=ids).order_by(ranking)
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    # Fallback for databases without a full-text engine; needs no index
+    def search(self, queryset, query):
+        for term in tokenize(query):
+            condition = Q()
+            for field, _ in SEARCH_FIELDS:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 virtual table ranked with bm25, kept next to the products table."""
+
+    def match_expression(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return queryset
+        weights = ', '.join(str(weight) for _, weight in SEARCH_FIELDS)
+        # Filter and rank inside the queryset itself, so the other filters and
+        # the pagination apply to every match and not to a pre-cut top N.
+        # Ids are stored as 32-char hex on SQLite, as in the FTS table.
+        matches = RawSQL(f'SELECT product_id FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s', [expression])
+        rank = RawSQL(
+            f'SELECT bm25("{FTS_TABLE}", 0, {weights}) FROM "{FTS_TABLE}" '
+            f'WHERE "{FTS_TABLE}" MATCH %s AND "{FTS_TABLE}"."product_id" = "{Products._meta.db_table}"."id"',
+            [expression], output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank).order_by('search_rank', 'id')
+
+    def index_products(self, products):
+        rows = [(product.pk.hex, product.name, product.brand, product.description) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM "{FTS_TABLE}" WHERE product_id = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO "{FTS_TABLE}" (product_id, name, brand, description) VALUES (%s, %s, %s, %s)', rows
+            )
+
+    def remove_products(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM "{FTS_TABLE}" WHERE product_id = %s', [(uuid.UUID(str(pk)).hex,) for pk in ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}"')
+            cursor.execute(
+                f'INSERT INTO "{FTS_TABLE}" (product_id, name, brand, description) '
+                f'SELECT id, name, brand, description FROM "{Products._meta.db_table}"'
+            )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector column on products, searched through a GIN index."""
+    config = 'simple'
+
+    def document(self):
+        from django.contrib.postgres.search import SearchVector
+        labels = dict(zip((field for field, _ in SEARCH_FIELDS), 'ABC'))
+        vector = None
+        for field, _ in SEARCH_FIELDS:
+            part = SearchVector(field, weight=labels[field], config=self.config)
+            vector = part if vector is None else vector + part
+        return vector
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+        tsquery = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=self.config)
+        return (
+            queryset.filter(search_vector=tsquery)
+            .annotate(search_rank=SearchRank(F('search_vector'), tsquery))
+            .order_by('-search_rank', 'id')
+        )
+
+    def index_products(self, products):
+        Products.objects.filter(pk__in=[product.pk for product in products]).update(search_vector=self.document())
+
+    def rebuild(self):
+        Products.objects.update(search_vector=self.document())
+
+
+def get_search_backend():
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SimpleSearchBackend()
+
+
+@receiver(post_save, sender=Products)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Products)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
@@ -1,9 +1,10 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Products, Reviews
 
 class SzReview(serializers.ModelSerializer):
-    user = serializers.StringRelatedField()  # عرض اسم المستخدم بدلاً من الـ ID
-    product = serializers.StringRelatedField()  # عرض اسم المنتج بدلاً من الـ ID
+    user = serializers.CharField(source='user.username', read_only=True)  # عرض اسم المستخدم بدلاً من الـ ID
+    product = serializers.CharField(source='product.name', read_only=True)  # عرض اسم المنتج بدلاً من الـ ID
     class Meta:
         model = Reviews
         fields = '__all__'
@@ -15,9 +16,60 @@ class SzProducts(serializers.ModelSerializer):
     class Meta:
         model = Products
         # fields = '__all__'
-        fields = ['id', 'name', 'image', 'description', 'price', 'brand', 'category', 'rating', 'stock', 'created_at', 'publisher', 'reviews']
-        read_only_fields = ['id'] 
+        fields = ['id', 'name', 'image', 'image_thumbnail', 'image_medium', 'image_webp', 'description', 'price', 'brand', 'category', 'rating', 'stock', 'created_at', 'publisher', 'reviews']
+        read_only_fields = ['id', 'image_thumbnail', 'image_medium', 'image_webp']
+
+    # Serializer fields that are not plain columns of Products
+    RELATED_FIELDS = {'publisher', 'reviews'}
+    # Always loaded: the primary key and the sort keys used by the cursor paginator
+    REQUIRED_COLUMNS = {'id', 'created_at', 'price'}
+
+    def __init__(self, *args, **kwargs):
+        # fields=[...] keeps only those fields in the output (sparse fieldsets)
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, reviews_limit=None, fields=None):
+        """
+        Load everything the serializer touches in a fixed number of queries:
+        one for the products joined with their publisher and one for the
+        reviews joined with their authors, however many rows come back.
+        `reviews_limit` keeps only the newest N reviews of each product.
+        With `fields`, only those columns and relations are loaded at all.
+        """
+        if fields is not None:
+            columns = {name for name in fields if name not in cls.RELATED_FIELDS} & set(cls.Meta.fields)
+            columns |= cls.REQUIRED_COLUMNS
+            if 'publisher' in fields:
+                columns |= {'user', 'user__username'}
+            queryset = queryset.only(*columns)
+        if fields is None or 'publisher' in fields:
+            queryset = queryset.select_related('user')
+        else:
+            queryset = queryset.select_related(None)
+        if fields is not None and 'reviews' not in fields:
+            return queryset
+        reviews = Reviews.objects.select_related('user').order_by('-created_at', '-id')
+        if reviews_limit is not None:
+            reviews = reviews[:reviews_limit]
+        return queryset.prefetch_related(
+            Prefetch('reviews', queryset=reviews, to_attr='prefetched_reviews')
+        )
+
     def get_reviews(self, obj):
-        reviews = obj.reviews.all()
+        reviews = getattr(obj, 'prefetched_reviews', None)
+        if reviews is None:
+            reviews = obj.reviews.select_related('user')
         serializer = SzReview(reviews, many=True)
         return serializer.data
+
+
+class SzProductBatchItem(serializers.ModelSerializer):
+    # Fields a vendor may set through batch_products/
+    class Meta:
+        model = Products
+        fields = ['name', 'description', 'price', 'brand', 'category', 'stock']
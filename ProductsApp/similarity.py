@@ -0,0 +1,364 @@
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Products, Categories
+
+logger = logging.getLogger(__name__)
+
+# Layout of a feature row: one-hot category, hashed brand, price band, rating, hashed name tokens
+CATEGORY_COLUMNS = {value: column for column, (value, _) in enumerate(Categories.choices)}
+BRAND_BUCKETS = 32
+PRICE_BANDS = 16
+NAME_BUCKETS = 96
+BRAND_OFFSET = len(CATEGORY_COLUMNS)
+PRICE_OFFSET = BRAND_OFFSET + BRAND_BUCKETS
+RATING_OFFSET = PRICE_OFFSET + PRICE_BANDS
+NAME_OFFSET = RATING_OFFSET + 1
+DIMENSIONS = NAME_OFFSET + NAME_BUCKETS
+
+# How much each group of features counts towards the cosine score
+WEIGHTS = {'category': 1.0, 'brand': 0.6, 'price': 0.5, 'rating': 0.2, 'name': 1.0}
+
+FEATURES_FILE = 'features.npy'
+IDS_FILE = 'ids.npy'
+# (id, row) pairs sorted by id, one file so readers never pair mismatched halves
+SORTED_FILE = 'sorted.npy'
+SORTED_DTYPE = np.dtype([('id', 'S32'), ('row', '<i8')])
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+CHUNK_ROWS = 65536
+
+
+def similarity_dir():
+    return str(getattr(settings, 'PRODUCT_SIMILARITY_DIR', os.path.join(settings.BASE_DIR, 'similarity_index')))
+
+
+def bucket(text, buckets):
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(text.encode('utf-8')) % buckets
+
+
+def price_band(price):
+    return min(int(math.log2(float(price or 0) + 1)), PRICE_BANDS - 1)
+
+
+def encode(rows):
+    """
+    Feature matrix for (name, brand, category, price, rating) rows, one
+    L2-normalized float32 row each, so a dot product is the cosine score.
+    Neighbouring price bands get half weight, so close prices still match.
+    """
+    rows = list(rows)
+    matrix = np.zeros((len(rows), DIMENSIONS), dtype=np.float32)
+    for i, (name, brand, category, price, rating) in enumerate(rows):
+        if category in CATEGORY_COLUMNS:
+            matrix[i, CATEGORY_COLUMNS[category]] = WEIGHTS['category']
+        if brand:
+            matrix[i, BRAND_OFFSET + bucket(brand.strip().lower(), BRAND_BUCKETS)] = WEIGHTS['brand']
+        band = price_band(price)
+        matrix[i, PRICE_OFFSET + band] = WEIGHTS['price']
+        for neighbour in (band - 1, band + 1):
+            if 0 <= neighbour < PRICE_BANDS:
+                matrix[i, PRICE_OFFSET + neighbour] = WEIGHTS['price'] / 2
+        matrix[i, RATING_OFFSET] = WEIGHTS['rating'] * float(rating or 0) / 5
+        for token in re.findall(r'\w+', (name or '').lower()):
+            matrix[i, NAME_OFFSET + bucket(token, NAME_BUCKETS)] += 1
+    names = matrix[:, NAME_OFFSET:]
+    name_norms = np.linalg.norm(names, axis=1, keepdims=True)
+    names *= WEIGHTS['name'] / np.maximum(name_norms, 1e-12)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.maximum(norms, 1e-12)
+    return matrix
+
+
+def encode_products(products):
+    return encode((p.name, p.brand, p.category, p.price, p.rating) for p in products)
+
+
+def id_key(pk):
+    return uuid.UUID(str(pk)).hex.encode('ascii')
+
+
+@contextmanager
+def write_lock(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'w') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def read_meta(directory):
+    with open(os.path.join(directory, META_FILE)) as handle:
+        return json.load(handle)
+
+
+def write_meta(directory, count, capacity):
+    # Readers reopen the files when the version changes
+    path = os.path.join(directory, META_FILE)
+    with open(path + '.tmp', 'w') as handle:
+        json.dump({'count': count, 'capacity': capacity, 'dimensions': DIMENSIONS, 'version': time.time_ns()}, handle)
+    os.replace(path + '.tmp', path)
+
+
+def build_similarity_index(batch_size=20000):
+    """
+    Encode the whole catalog into fresh files and swap them in. Workers that
+    still map the old files keep reading them until they notice the new
+    version. Spare rows are left at the end for products added later.
+    """
+    directory = similarity_dir()
+    with write_lock(directory):
+        count = Products.objects.count()
+        capacity = count + max(1024, count // 10)
+        features = np.lib.format.open_memmap(
+            os.path.join(directory, FEATURES_FILE + '.tmp'), mode='w+', dtype=np.float32, shape=(capacity, DIMENSIONS)
+        )
+        ids = np.lib.format.open_memmap(os.path.join(directory, IDS_FILE + '.tmp'), mode='w+', dtype='S32', shape=(capacity,))
+        row = 0
+        batch = []
+        products = Products.objects.only('id', *Products.FEATURE_FIELDS).order_by('id').iterator(chunk_size=batch_size)
+        for product in products:
+            batch.append(product)
+            if len(batch) == batch_size or row + len(batch) == capacity:
+                row = _write_rows(features, ids, row, batch)
+                batch = []
+        if batch:
+            row = _write_rows(features, ids, row, batch)
+        features.flush()
+        ids.flush()
+        order = np.argsort(ids[:row], kind='stable')
+        lookup = np.empty(row, dtype=SORTED_DTYPE)
+        lookup['id'] = ids[:row][order]
+        lookup['row'] = order
+        del features, ids
+        os.replace(os.path.join(directory, FEATURES_FILE + '.tmp'), os.path.join(directory, FEATURES_FILE))
+        os.replace(os.path.join(directory, IDS_FILE + '.tmp'), os.path.join(directory, IDS_FILE))
+        write_sorted(directory, lookup)
+        write_meta(directory, row, capacity)
+    return row
+
+
+def write_sorted(directory, lookup):
+    # Swapped in whole; readers that mapped the old file keep a consistent copy
+    path = os.path.join(directory, SORTED_FILE)
+    with open(path + '.tmp', 'wb') as handle:
+        np.save(handle, lookup)
+    os.replace(path + '.tmp', path)
+
+
+def find_rows(lookup, keys):
+    """Positions in `lookup` of each key (or -1), by binary search."""
+    keys = np.asarray(keys, dtype='S32')
+    positions = np.searchsorted(lookup['id'], keys)
+    found = positions < len(lookup)
+    found[found] = lookup['id'][positions[found]] == keys[found]
+    return np.where(found, positions, -1)
+
+
+def _write_rows(features, ids, start, products):
+    end = min(start + len(products), len(ids))
+    products = products[:end - start]
+    features[start:end] = encode_products(products)
+    ids[start:end] = [id_key(product.pk) for product in products]
+    return end
+
+
+def update_similarity_rows(product_ids):
+    """
+    Re-encode the given products in place. Changed products overwrite their
+    row, new ones take a spare row, deleted ones are blanked. Rows are found
+    by binary search in the sorted id file, which is only rewritten (and
+    the meta version only bumped) when products were added or deleted; a
+    plain edit is visible to readers through the shared mapping already.
+    Falls back to a full rebuild when the index is missing, out of spare
+    rows or was built with another feature layout (e.g. before a category
+    was added).
+    """
+    directory = similarity_dir()
+    if (
+        not os.path.exists(os.path.join(directory, META_FILE))
+        or not os.path.exists(os.path.join(directory, SORTED_FILE))
+        or read_meta(directory).get('dimensions') != DIMENSIONS
+    ):
+        return build_similarity_index()
+    with write_lock(directory):
+        meta = read_meta(directory)
+        count = meta['count']
+        lookup = np.load(os.path.join(directory, SORTED_FILE))
+        keys = [id_key(pk) for pk in product_ids]
+        positions = dict(zip(keys, find_rows(lookup, keys).tolist()))
+        products = {id_key(p.pk): p for p in Products.objects.filter(pk__in=product_ids).only('id', *Products.FEATURE_FIELDS)}
+        added = [key for key in products if positions[key] < 0]
+        if count + len(added) > meta['capacity']:
+            rebuild = True
+        else:
+            rebuild = False
+            features = np.load(os.path.join(directory, FEATURES_FILE), mmap_mode='r+')
+            ids = np.load(os.path.join(directory, IDS_FILE), mmap_mode='r+')
+            removed = []
+            new_rows = []
+            for key in dict.fromkeys(keys):
+                product = products.get(key)
+                position = positions[key]
+                if product is None:
+                    if position >= 0:
+                        row = int(lookup['row'][position])
+                        features[row] = 0
+                        ids[row] = b''
+                        removed.append(position)
+                    continue
+                if position >= 0:
+                    row = int(lookup['row'][position])
+                else:
+                    row = count
+                    count += 1
+                    ids[row] = key
+                    new_rows.append((key, row))
+                features[row] = encode_products([product])[0]
+            features.flush()
+            ids.flush()
+            del features, ids
+            if removed or new_rows:
+                lookup = np.delete(lookup, removed)
+                inserted = np.array(sorted(new_rows), dtype=SORTED_DTYPE)
+                lookup = np.insert(lookup, np.searchsorted(lookup['id'], inserted['id']), inserted)
+                write_sorted(directory, lookup)
+                write_meta(directory, count, meta['capacity'])
+    if rebuild:
+        return build_similarity_index()
+    return count
+
+
+class SimilarityIndex:
+    """
+    Read side of the feature files. The matrix and the sorted id file are
+    memory-mapped, so every worker shares the same pages of the OS cache,
+    opening a new version costs no sort, and in-place row updates are
+    visible at once.
+    """
+
+    def __init__(self, directory):
+        meta = read_meta(directory)
+        self.version = meta['version']
+        self.count = meta['count']
+        self.features = np.load(os.path.join(directory, FEATURES_FILE), mmap_mode='r')[:self.count]
+        self.ids = np.load(os.path.join(directory, IDS_FILE), mmap_mode='r')[:self.count]
+        try:
+            self.lookup = np.load(os.path.join(directory, SORTED_FILE), mmap_mode='r')
+        except FileNotFoundError:
+            # Index written before the sorted file existed; the next update rebuilds it
+            order = np.argsort(self.ids, kind='stable')
+            self.lookup = np.empty(self.count, dtype=SORTED_DTYPE)
+            self.lookup['id'] = self.ids[order]
+            self.lookup['row'] = order
+        self.checked_at = time.monotonic()
+
+    def row_of(self, pk):
+        position = int(find_rows(self.lookup, [id_key(pk)])[0])
+        return int(self.lookup['row'][position]) if position >= 0 else None
+
+    def similar(self, pk, k=10):
+        return self.similar_many([pk], k)[0]
+
+    def similar_many(self, pks, k=10):
+        """
+        Top-k most similar product ids for each of `pks`, scored in one
+        matrix product per chunk of the catalog. Unknown ids get [].
+        """
+        rows = [self.row_of(pk) for pk in pks]
+        known = [row for row in rows if row is not None]
+        results = {}
+        if known:
+            queries = np.asarray(self.features[known]).T
+            best_scores = np.full((len(known), 0), -np.inf, dtype=np.float32)
+            best_rows = np.zeros((len(known), 0), dtype=np.int64)
+            for start in range(0, self.count, CHUNK_ROWS):
+                scores = np.asarray(self.features[start:start + CHUNK_ROWS]) @ queries
+                scores = scores.T
+                for i, row in enumerate(known):
+                    if start <= row < start + CHUNK_ROWS:
+                        scores[i, row - start] = -np.inf
+                take = min(k, scores.shape[1])
+                top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+                best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+                best_rows = np.concatenate([best_rows, top + start], axis=1)
+                if best_scores.shape[1] > k:
+                    keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                    best_rows = np.take_along_axis(best_rows, keep, axis=1)
+            for i, row in enumerate(known):
+                ranking = np.argsort(-best_scores[i], kind='stable')
+                results[row] = [
+                    uuid.UUID(self.ids[best_rows[i, j]].decode('ascii'))
+                    for j in ranking if best_scores[i, j] > 0
+                ]
+        return [results.get(row, []) if row is not None else [] for row in rows]
+
+
+_index = None
+
+
+def get_similarity_index():
+    """
+    The process-wide index, or None before the first build. Re-reads the
+    meta file at most every PRODUCT_SIMILARITY_REFRESH_SECONDS and reopens
+    the files when another process appended rows or rebuilt them.
+    """
+    global _index
+    directory = similarity_dir()
+    index = _index
+    refresh = getattr(settings, 'PRODUCT_SIMILARITY_REFRESH_SECONDS', 10)
+    if index is not None and time.monotonic() - index.checked_at < refresh:
+        return index
+    try:
+        version = read_meta(directory)['version']
+    except (OSError, ValueError, KeyError):
+        return index
+    if index is None or index.version != version:
+        index = _index = SimilarityIndex(directory)
+    index.checked_at = time.monotonic()
+    return index
+
+
+def reset_similarity_index():
+    global _index
+    _index = None
+
+
+def schedule_similarity_update(product_ids):
+    from .tasks import update_similar_products
+    try:
+        update_similar_products.delay([str(pk) for pk in product_ids])
+    except Exception:
+        # The similar rail just stays stale until the next rebuild
+        logger.exception('Could not queue the similarity update for products %s', product_ids)
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def queue_similarity_update(sender, instance, raw=False, signal=None, **kwargs):
+    if raw:
+        return
+    if signal is post_save and not kwargs.get('created'):
+        # Stock and other edits that do not change the features need no update
+        current = instance.feature_values()
+        if current == getattr(instance, '_loaded_features', None):
+            return
+        instance._loaded_features = current
+    product_id = instance.pk
+    transaction.on_commit(lambda: schedule_similarity_update([product_id]))
@@ -0,0 +1,38 @@
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+STREAM_CHUNK_SIZE = 500
+
+
+def iter_json_array(queryset, serializer, chunk_size=STREAM_CHUNK_SIZE):
+    # Same shape as the buffered response: {"data": [...]}
+    encoder = JSONEncoder()
+    yield '{"data": ['
+    first = True
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        item = encoder.encode(serializer.to_representation(obj))
+        yield item if first else ',' + item
+        first = False
+    yield ']}'
+
+
+def iter_ndjson(queryset, serializer, chunk_size=STREAM_CHUNK_SIZE):
+    encoder = JSONEncoder()
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield encoder.encode(serializer.to_representation(obj)) + '\n'
+
+
+def streaming_response(queryset, serializer, ndjson=False, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream a serialized queryset without building the whole list in memory.
+    Rows are read `chunk_size` at a time (prefetches run per chunk), so peak
+    memory depends on the chunk size, not on the size of the catalog.
+    """
+    if ndjson:
+        return StreamingHttpResponse(
+            iter_ndjson(queryset, serializer, chunk_size), content_type='application/x-ndjson'
+        )
+    return StreamingHttpResponse(
+        iter_json_array(queryset, serializer, chunk_size), content_type='application/json'
+    )
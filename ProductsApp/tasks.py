@@ -1,6 +1,67 @@
 # app_name/tasks.py
 from celery import shared_task
+from .models import Products
+from .images import build_derivatives
+from .cache import invalidate_products
+from .similarity import build_similarity_index, update_similarity_rows
 
-# @shared_task
-# def add(x, y):
-#     return x + y
+
+@shared_task
+def generate_image_derivatives(product_id):
+    product = Products.objects.filter(pk=product_id).only('id', 'image').first()
+    if product is None or not product.image:
+        return None
+    names = build_derivatives(product)
+    # Skip the write if the image was replaced while we were resizing
+    updated = Products.objects.filter(pk=product_id, image=product.image.name).update(**names)
+    if updated:
+        invalidate_products([product_id])
+    return names
+
+
+@shared_task
+def build_product_neighbours():
+    # Offline item-to-item co-occurrence job, scheduled by CELERY_BEAT_SCHEDULE
+    from utils.recommendations import build_product_neighbours as build
+    return build()
+
+
+@shared_task
+def warm_recommendations_for_active_users(days=1):
+    # Fill the recommendation cache ahead of the next visit of recently active users
+    from datetime import timedelta
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.utils import timezone
+    from utils.recommendations import recommendation_cache_key, warm_recommendations
+    warmed = 0
+    users = User.objects.filter(is_active=True, last_login__gte=timezone.now() - timedelta(days=days))
+    for user in users.iterator(chunk_size=500):
+        if cache.get(recommendation_cache_key(user.pk)) is None:
+            warm_recommendations(user)
+            warmed += 1
+    return warmed
+
+
+@shared_task
+def reconcile_wishlist_counts():
+    # Periodic safety net for Products.wishlist_count (writes that skipped m2m_changed)
+    from AccountsApp.models import reconcile_wishlist_counts as reconcile
+    return len(reconcile())
+
+
+@shared_task
+def update_similar_products(product_ids):
+    return update_similarity_rows(product_ids)
+
+
+@shared_task
+def rebuild_similar_products():
+    # Full re-encode, also picks up rating changes made by review updates
+    return build_similarity_index()
+
+
+@shared_task
+def refresh_trending_products():
+    from .trending import refresh_trending
+    return {key: len(ranking) for key, ranking in refresh_trending().items()}
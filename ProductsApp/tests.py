@@ -1,3 +1,973 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+import numpy as np
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from ProductsApp.models import Products, Reviews, ProductNeighbour, TrendingBucket, reconcile_product_ratings
+from ProductsApp.cache import PRODUCT_CACHE_STATS
+from ProductsApp.filters import ProductFilters
+from ProductsApp.search import get_search_backend
+from ProductsApp.autocomplete import PrefixIndex, reset_index
+from ProductsApp.trending import flush_events, get_trending, record_event, refresh_trending
+from ProductsApp.similarity import (
+    build_similarity_index, encode_products, get_similarity_index, read_meta, reset_similarity_index, similarity_dir,
+    update_similarity_rows,
+)
+from ProductsApp.tasks import generate_image_derivatives, build_product_neighbours
+from OrdersApp.models import Order, OrderItem
+from AccountsApp.models import Wishlist
+from utils.cache_stats import get_cache_stats
+from utils.recommendations import RECOMMENDATION_CACHE_STATS
 
-# Create your tests here.
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='vendor', password='testpassword')
+        for i in range(7):
+            Products.objects.create(
+                name=f'Phone {i}', description='phone', price=Decimal(100 + (i % 3)),
+                brand='Samsung', category='Computer', stock=5, user=self.user,
+            )
+        self.url = '/api/products/get_filtered_pages/'
+
+    def collect_pages(self, params):
+        names, url, pages = [], self.url, 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names += [p['name'] for p in response.data['results']['data']]
+            pages += 1
+            if not response.data['next']:
+                return names, pages
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_walk_the_whole_catalog_once(self):
+        """Following `next` cursors returns every product exactly once."""
+        names, pages = self.collect_pages({'pagination': 'cursor', 'page_size': 3})
+        self.assertEqual(sorted(names), sorted(f'Phone {i}' for i in range(7)))
+        self.assertEqual(pages, 3)
+
+    def test_cursor_pages_order_by_price_with_ties(self):
+        """Equal prices are broken by id so no row is skipped or repeated."""
+        names, _ = self.collect_pages({'pagination': 'cursor', 'ordering': 'price', 'page_size': 2})
+        prices = [Products.objects.get(name=name).price for name in names]
+        self.assertEqual(len(set(names)), 7)
+        self.assertEqual(prices, sorted(prices))
+
+    def test_skip_count_and_page_size_cap(self):
+        response = self.client.get(self.url, {'pagination': 'cursor', 'skip_count': '1', 'page_size': 1000})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']['data']), 7)
+        response = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertEqual(response.data['count'], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']['data']), 2)
+
+
+class ProductListQueryCountTests(APITestCase):
+
+    def setUp(self):
+        self.vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.reviewers = [User.objects.create_user(username=f'buyer{i}', password='testpassword') for i in range(3)]
+
+    def add_products(self, count):
+        for i in range(count):
+            product = Products.objects.create(
+                name=f'Laptop {i}', description='laptop', price=Decimal('900.00'),
+                brand='Dell', category='Computer', stock=5, user=self.vendor,
+            )
+            for j, reviewer in enumerate(self.reviewers):
+                Reviews.objects.create(product=product, user=reviewer, rating=j + 1, comment='ok')
+
+    def test_list_views_use_a_fixed_number_of_queries(self):
+        """Serializing more products and reviews does not add queries."""
+        for url in ('/api/products/all_products/', '/api/products/get_filtered_products/'):
+            self.add_products(2)
+            with self.assertNumQueries(2):
+                small = self.client.get(url)
+            self.add_products(5)
+            with self.assertNumQueries(2):
+                large = self.client.get(url)
+            self.assertGreater(len(large.data['data']), len(small.data['data']))
+            Products.objects.all().delete()
+
+    def test_nested_reviews_show_names_and_respect_limit(self):
+        self.add_products(2)
+        response = self.client.get('/api/products/all_products/', {'reviews_limit': 2})
+        for product in response.data['data']:
+            self.assertEqual(product['publisher'], 'vendor')
+            self.assertEqual(len(product['reviews']), 2)
+            self.assertEqual(product['reviews'][0]['user'], 'buyer2')
+            self.assertEqual(product['reviews'][0]['product'], product['name'])
+
+
+class StreamingProductsTests(APITestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        for i in range(3):
+            Products.objects.create(name=f'Tablet {i}', description='tablet', price=Decimal('250.00'),
+                                    brand='Lenovo', category='Computer', stock=2, user=vendor)
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_stream_json_matches_buffered_shape(self):
+        body = json.loads(self.read(self.client.get('/api/products/all_products/', {'stream': 'json'})))
+        self.assertEqual(sorted(p['name'] for p in body['data']), ['Tablet 0', 'Tablet 1', 'Tablet 2'])
+
+    def test_stream_ndjson(self):
+        response = self.client.get('/api/products/all_products/', {'stream': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = self.read(response).splitlines()
+        self.assertEqual([json.loads(line)['brand'] for line in lines], ['Lenovo'] * 3)
+
+
+class KeywordSearchTests(APITestCase):
+
+    def setUp(self):
+        self.vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.make('Galaxy S24 Ultra', 'Samsung', 'flagship phone with stylus')
+        self.make('Pixel 9', 'Google', 'phone with a great camera, rivals the Galaxy line')
+        self.make('Galaxy Watch', 'Samsung', 'smart watch')
+        self.make('ThinkPad X1', 'Lenovo', 'business laptop')
+
+    def make(self, name, brand, description):
+        return Products.objects.create(name=name, brand=brand, description=description, price=Decimal('10.00'),
+                                       category='Computer', stock=1, user=self.vendor)
+
+    def search(self, keyword):
+        response = self.client.get('/api/products/get_filtered_products/', {'keyword': keyword})
+        return [p['name'] for p in response.data['data']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        names = self.search('galaxy')
+        self.assertEqual(len(names), 3)
+        self.assertEqual(names[-1], 'Pixel 9')
+
+    def test_prefix_and_multi_field_terms(self):
+        self.assertEqual(self.search('think'), ['ThinkPad X1'])
+        self.assertEqual(self.search('samsung wat'), ['Galaxy Watch'])
+        self.assertEqual(self.search('camera'), ['Pixel 9'])
+
+    def test_index_follows_saves_and_deletes(self):
+        laptop = Products.objects.get(name='ThinkPad X1')
+        laptop.name = 'Yoga Slim'
+        laptop.save()
+        self.assertEqual(self.search('thinkpad'), [])
+        self.assertEqual(self.search('yoga'), ['Yoga Slim'])
+        laptop.delete()
+        self.assertEqual(self.search('yoga'), [])
+
+    def test_filters_apply_to_every_match(self):
+        for i in range(5):
+            self.make(f'Galaxy Buds {i}', 'Samsung', 'galaxy galaxy earbuds')
+        response = self.client.get('/api/products/get_filtered_products/', {'keyword': 'galaxy', 'brand': 'google'})
+        self.assertEqual([p['name'] for p in response.data['data']], ['Pixel 9'])
+        facets = self.client.get('/api/products/product_facets/', {'keyword': 'galaxy'}).data['data']
+        self.assertEqual(facets['brands'], [{'value': 'Samsung', 'count': 7}, {'value': 'Google', 'count': 1}])
+
+
+class ProductFacetsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        for name, brand, category, price, rating in [
+            ('Mac Mini', 'Apple', 'Computer', '599.00', '4.50'),
+            ('MacBook Air', 'Apple', 'Computer', '999.00', '4.00'),
+            ('XPS 13', 'Dell', 'Computer', '950.00', '3.20'),
+            ('Blender', 'Philips', 'Home', '80.00', '0.00'),
+        ]:
+            Products.objects.create(name=name, brand=brand, category=category, price=Decimal(price),
+                                    rating=Decimal(rating), description=name, stock=3, user=vendor)
+
+    def test_counts_for_current_filters_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/product_facets/', {'min_price': 500})
+        facets = response.data['data']
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(facets['categories'], [{'value': 'Computer', 'count': 3}])
+        self.assertEqual(facets['brands'], [{'value': 'Apple', 'count': 2}, {'value': 'Dell', 'count': 1}])
+        self.assertEqual(facets['price_buckets'], [
+            {'min': 500, 'max': 600, 'count': 1},
+            {'min': 900, 'max': 1000, 'count': 2},
+        ])
+        self.assertEqual([r['count'] for r in facets['ratings']], [0, 0, 0, 1, 2, 0])
+
+    def test_results_are_cached_per_normalized_filters(self):
+        self.client.get('/api/products/product_facets/', {'brand': 'Apple'})
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/product_facets/', {'brand': ' apple ', 'page': 3})
+        self.assertEqual(response.data['data']['total'], 2)
+
+
+class ProductDetailCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.buyer = User.objects.create_user(username='buyer', password='testpassword')
+        self.product = Products.objects.create(name='Kettle', brand='Philips', category='Home', price=Decimal('30.00'),
+                                               description='kettle', stock=4, user=self.vendor)
+        self.url = f'/api/products/one_product/{self.product.pk}/'
+
+    def test_repeat_reads_skip_the_database(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['data']['name'], 'Kettle')
+        stats = get_cache_stats(PRODUCT_CACHE_STATS)
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_product_and_review_changes_invalidate(self):
+        self.client.get(self.url)
+        self.product.price = Decimal('25.00')
+        self.product.save()
+        self.assertEqual(self.client.get(self.url).data['data']['price'], '25.00')
+        Reviews.objects.create(product=self.product, user=self.buyer, rating=5, comment='great')
+        self.assertEqual(len(self.client.get(self.url).data['data']['reviews']), 1)
+
+
+class ConditionalCatalogTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.product = Products.objects.create(name='Toaster', brand='Philips', category='Home', price=Decimal('45.00'),
+                                               description='toaster', stock=4, user=vendor)
+
+    def test_unchanged_catalog_answers_304_without_queries(self):
+        for url in ('/api/products/all_products/', '/api/products/get_filtered_pages/',
+                    f'/api/products/one_product/{self.product.pk}/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_product_change_issues_a_new_validator(self):
+        url = '/api/products/get_filtered_products/'
+        etag = self.client.get(url)['ETag']
+        self.product.stock = 0
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class RatingAggregateTests(APITestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.buyers = [User.objects.create_user(username=f'buyer{i}', password='testpassword') for i in range(3)]
+        self.product = Products.objects.create(name='Router', brand='TP-Link', category='Computer',
+                                               price=Decimal('70.00'), description='router', stock=9, user=vendor)
+
+    def review(self, buyer, rating):
+        return Reviews.objects.create(product=self.product, user=buyer, rating=rating, comment='-')
+
+    def assertAggregates(self, rating, count, total):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating, self.product.review_count, self.product.rating_sum),
+                         (Decimal(rating), count, total))
+
+    def test_create_edit_delete_apply_deltas(self):
+        with self.assertNumQueries(2):  # INSERT review + UPDATE product
+            first = self.review(self.buyers[0], 5)
+        self.review(self.buyers[1], 4)
+        self.review(self.buyers[2], 4)
+        self.assertAggregates('4.33', 3, 13)
+        first = Reviews.objects.get(pk=first.pk)
+        first.rating = 2
+        first.save()
+        self.assertAggregates('3.33', 3, 10)
+        first.delete()
+        self.assertAggregates('4.00', 2, 8)
+        Reviews.objects.all().delete()
+        self.assertAggregates('0.00', 0, 0)
+
+    def test_reconcile_fixes_drift(self):
+        self.review(self.buyers[0], 3)
+        Products.objects.filter(pk=self.product.pk).update(rating_sum=40, review_count=7, rating=Decimal('1.00'))
+        self.assertEqual(reconcile_product_ratings(), [self.product.pk])
+        self.assertAggregates('3.00', 1, 3)
+        self.assertEqual(reconcile_product_ratings(), [])
+
+    def test_product_edit_leaves_the_aggregates_alone(self):
+        stale = Products.objects.get(pk=self.product.pk)
+        self.review(self.buyers[0], 4)  # lands after the vendor loaded the product
+        self.client.force_authenticate(self.product.user)
+        with mock.patch('ProductsApp.views.get_object_or_404', return_value=stale):
+            response = self.client.put(f'/api/products/update_product/{self.product.pk}/', {
+                'name': 'Router AX', 'description': 'wifi 6', 'price': '80.00', 'brand': 'TP-Link',
+                'catagory': 'Computer', 'rating': '1', 'stock': 4,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAggregates('4.00', 1, 4)
+        self.assertEqual((self.product.name, self.product.stock), ('Router AX', 4))
+
+
+class ImportProductsCommandTests(TestCase):
+
+    def setUp(self):
+        self.vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def test_csv_upserts_by_sku_and_reports_rejects(self):
+        Products.objects.create(sku='A-1', name='Old name', brand='Acme', category='Home', price=Decimal('1.00'),
+                                description='old', stock=1, user=self.vendor)
+        path = self.write('feed.csv', (
+            'sku,name,descriptin,price,brand,category,stock\n'
+            'A-1,Desk Lamp,warm light,19.90,Acme,Home,12\n'
+            'A-2,Office Chair,ergonomic,149,Acme,Home,3\n'
+            'A-3,Bad Row,nope,abc,Acme,Home,1\n'
+            'A-4,Gadget,unknown category,5,Acme,Garden,1\n'
+        ))
+        rejects = os.path.join(self.tmp.name, 'rejects.csv')
+        out = io.StringIO()
+        call_command('import_products', path, user='vendor', batch_size=2, rejects=rejects, stdout=out, stderr=io.StringIO())
+        self.assertIn('Imported 2 product(s), rejected 2 row(s)', out.getvalue())
+        lamp = Products.objects.get(sku='A-1')
+        self.assertEqual((lamp.name, lamp.price, lamp.stock), ('Desk Lamp', Decimal('19.90'), 12))
+        self.assertEqual(Products.objects.count(), 2)
+        with open(rejects, encoding='utf-8') as handle:
+            self.assertEqual([row[0] for row in csv.reader(handle)], ['row', '4', '5'])
+        self.assertEqual([p.sku for p in get_search_backend().search(Products.objects.all(), 'chair')], ['A-2'])
+
+    def test_ndjson_import(self):
+        path = self.write('feed.ndjson', (
+            '{"sku": "N-1", "name": "Kids Bike", "description": "bike", "price": 120, "brand": "Trek", "category": "Kids", "stock": 4}\n'
+            'not json\n'
+        ))
+        call_command('import_products', path, user='vendor', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Products.objects.get(sku='N-1').brand, 'Trek')
+
+    def test_ndjson_lines_that_are_not_objects_are_rejected(self):
+        path = self.write('feed.ndjson', (
+            '[1, 2]\n'
+            'null\n'
+            '{"sku": "N-2", "name": "Scooter", "description": "scooter", "price": 80, "brand": "Razor", "category": "Kids", "stock": 2}\n'
+        ))
+        rejects = os.path.join(self.tmp.name, 'rejects.csv')
+        out = io.StringIO()
+        call_command('import_products', path, user='vendor', rejects=rejects, stdout=out, stderr=io.StringIO())
+        self.assertIn('Imported 1 product(s), rejected 2 row(s)', out.getvalue())
+        with open(rejects, encoding='utf-8') as handle:
+            self.assertEqual([row[0] for row in csv.reader(handle)], ['row', '1', '2'])
+
+    def test_xlsx_import_with_title_rows(self):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['Products'])
+        sheet.append(['sku', 'name', 'description', 'price', 'brand', 'category', 'stock'])
+        sheet.append(['X-1', 'Galaxy Tab', 'tablet', 300, 'Samsung', 'Computer', 8])
+        path = os.path.join(self.tmp.name, 'feed.xlsx')
+        workbook.save(path)
+        call_command('import_products', path, user='vendor', header_row=2, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Products.objects.get(sku='X-1').stock, 8)
+
+    def test_shipped_sample_workbook(self):
+        """Test the repo's test-database.xlsx: title rows, id as sku, other tables below the products."""
+        out = io.StringIO()
+        path = os.path.join(settings.BASE_DIR, 'test-database.xlsx')
+        call_command('import_products', path, user='vendor', stdout=out, stderr=io.StringIO())
+        self.assertIn('Imported 1 product(s), rejected 0 row(s)', out.getvalue())
+        product = Products.objects.get()
+        self.assertEqual(
+            (product.sku, product.name, product.category, product.description, product.price, product.stock),
+            ('56481dsfsdf55464s5df', 's24 altra', 'Mobile', 'sam sam sam', Decimal('90000'), 13),
+        )
+
+    def test_other_vendors_skus_are_not_overwritten(self):
+        rival = User.objects.create_user(username='rival', password='testpassword')
+        Products.objects.create(sku='R-1', name='Rival Phone', brand='Acme', category='Mobile', price=Decimal('5.00'),
+                                description='theirs', stock=1, user=rival)
+        path = self.write('feed.csv', (
+            'sku,name,description,price,brand,category,stock\n'
+            'R-1,Hijacked,mine,1,Acme,mobile,9\n'
+            'V-1,Own Phone,mine,2,Acme,MOBILE,4\n'
+        ))
+        out = io.StringIO()
+        call_command('import_products', path, user='vendor', stdout=out, stderr=io.StringIO())
+        self.assertIn('Imported 1 product(s), rejected 1 row(s)', out.getvalue())
+        self.assertEqual(Products.objects.get(sku='R-1').name, 'Rival Phone')
+        self.assertEqual(Products.objects.get(sku='V-1').category, 'Mobile')
+
+
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.vendor = User.objects.create_user(username='vendor', password='testpassword')
+
+    def upload(self):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGBA', (1600, 1200), (200, 30, 30, 255)).save(buffer, format='PNG')
+        return SimpleUploadedFile('phone.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_queues_task_and_task_writes_derivatives(self):
+        with mock.patch('ProductsApp.images.schedule_derivatives') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = Products.objects.create(name='Phone', brand='Nokia', category='Computer', price=Decimal('99.00'),
+                                                  description='phone', stock=1, user=self.vendor, image=self.upload())
+        schedule.assert_called_once_with(product.pk)
+
+        generate_image_derivatives(str(product.pk))
+        product.refresh_from_db()
+        from PIL import Image
+        with Image.open(product.image_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (200, 150))
+        with Image.open(product.image_webp.path) as webp:
+            self.assertEqual((webp.format, webp.size), ('WEBP', (800, 600)))
+
+    def test_unchanged_image_is_not_reprocessed(self):
+        product = Products.objects.create(name='Phone', brand='Nokia', category='Computer', price=Decimal('99.00'),
+                                          description='phone', stock=1, user=self.vendor, image=self.upload())
+        product = Products.objects.get(pk=product.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.stock = 5
+            product.save()
+        self.assertEqual(callbacks, [])
+
+    def test_deferred_image_is_not_reprocessed(self):
+        product = Products.objects.create(name='Phone', brand='Nokia', category='Computer', price=Decimal('99.00'),
+                                          description='phone', stock=1, user=self.vendor, image=self.upload())
+        product = Products.objects.only('id', 'stock').get(pk=product.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.stock = 5
+            product.save(update_fields=['stock'])
+        self.assertEqual(callbacks, [])
+
+        # Reading the deferred image loads the stored one rather than replacing it
+        product = Products.objects.only('id', 'stock').get(pk=product.pk)
+        self.assertTrue(product.image)
+        with mock.patch('ProductsApp.images.schedule_derivatives') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save(update_fields=['stock', 'image'])
+        schedule.assert_not_called()
+
+    def test_replacing_the_image_deletes_old_derivatives(self):
+        from django.core.files.storage import default_storage
+        with mock.patch('ProductsApp.images.schedule_derivatives') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = Products.objects.create(name='Phone', brand='Nokia', category='Computer', price=Decimal('99.00'),
+                                                  description='phone', stock=1, user=self.vendor, image=self.upload())
+            generate_image_derivatives(str(product.pk))
+            product.refresh_from_db()
+            old = [product.image_thumbnail.name, product.image_medium.name, product.image_webp.name]
+            self.assertTrue(all(default_storage.exists(name) for name in old))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                product.image = self.upload()
+                product.save()
+            self.assertEqual(schedule.call_count, 2)
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+        product.refresh_from_db()
+        self.assertIsNone(product.image_thumbnail.name)
+
+        generate_image_derivatives(str(product.pk))
+        product.refresh_from_db()
+        self.assertNotIn(product.image_thumbnail.name, old)
+        self.assertTrue(default_storage.exists(product.image_thumbnail.name))
+
+
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        buyer = User.objects.create_user(username='buyer', password='testpassword')
+        self.product = Products.objects.create(name='Monitor', brand='LG', category='Computer', price=Decimal('220.00'),
+                                               description='a' * 900, stock=6, user=vendor)
+        Reviews.objects.create(product=self.product, user=buyer, rating=4, comment='sharp')
+
+    def test_list_returns_only_requested_fields_from_one_narrow_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/all_products/', {'fields': 'id,name,price,image'})
+        self.assertEqual(set(response.data['data'][0]), {'id', 'name', 'price', 'image'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0]['sql'])
+
+    def test_publisher_without_reviews_is_joined(self):
+        for i in range(2):
+            vendor = User.objects.create_user(username=f'vendor{i}', password='testpassword')
+            Products.objects.create(name=f'Monitor {i}', brand='LG', category='Computer', price=Decimal('220.00'),
+                                    description='monitor', stock=6, user=vendor)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/all_products/', {'fields': 'id,name,publisher'})
+        self.assertEqual(sorted(product['publisher'] for product in response.data['data']),
+                         ['vendor', 'vendor0', 'vendor1'])
+
+    def test_expand_reviews_and_publisher(self):
+        response = self.client.get('/api/products/get_filtered_products/',
+                                   {'fields': 'name,publisher', 'expand': 'reviews'})
+        product = response.data['data'][0]
+        self.assertEqual(set(product), {'name', 'publisher', 'reviews'})
+        self.assertEqual((product['publisher'], product['reviews'][0]['comment']), ('vendor', 'sharp'))
+
+    def test_detail_fields_are_cut_from_the_cached_payload(self):
+        url = f'/api/products/one_product/{self.product.pk}/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'fields': 'name,stock'})
+        self.assertEqual(response.data['data'], {'name': 'Monitor', 'stock': 6})
+
+
+class ProductReviewsEndpointTests(APITestCase):
+
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.product = Products.objects.create(name='Speaker', brand='JBL', category='Home', price=Decimal('60.00'),
+                                               description='speaker', stock=3, user=vendor)
+        self.ratings = [5, 3, 5, 1, 4]
+        self.reviews = []
+        for i, rating in enumerate(self.ratings):
+            buyer = User.objects.create_user(username=f'buyer{i}', password='testpassword')
+            self.reviews.append(Reviews.objects.create(product=self.product, user=buyer, rating=rating, comment=f'#{i}'))
+        self.url = f'/api/products/product_reviews/{self.product.pk}/'
+
+    def test_pages_by_rating_with_histogram(self):
+        response = self.client.get(self.url, {'ordering': '-rating', 'page_size': 2})
+        results = response.data['results']
+        self.assertEqual(results['histogram'], {1: 1, 2: 0, 3: 1, 4: 1, 5: 2})
+        self.assertEqual(results['review_count'], 5)
+        ratings = [review['rating'] for review in results['reviews']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ratings += [review['rating'] for review in response.data['results']['reviews']]
+        self.assertEqual(ratings, sorted(self.ratings, reverse=True))
+
+    def test_histogram_follows_edits_and_deletes(self):
+        review = Reviews.objects.get(pk=self.reviews[1].pk)
+        review.rating = 2
+        review.save()
+        Reviews.objects.get(pk=self.reviews[0].pk).delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_histogram(), {1: 1, 2: 1, 3: 0, 4: 1, 5: 1})
+        Products.objects.filter(pk=self.product.pk).update(star_4_count=9)
+        self.assertEqual(reconcile_product_ratings(), [self.product.pk])
+
+    def test_delete_review_route(self):
+        review = self.reviews[0]
+        self.client.force_authenticate(review.user)
+        response = self.client.delete(f'/api/products/delete_review/{review.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Reviews.objects.filter(pk=review.pk).exists())
+
+
+class CatalogIndexTests(TestCase):
+    """EXPLAIN the filter hot paths so a schema change cannot silently bring back full scans."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(username='vendor', password='testpassword')
+        cls.product = Products.objects.create(name='Mouse', brand='Logitech', category='Computer',
+                                              price=Decimal('25.00'), description='mouse', stock=10, user=vendor)
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are always cheaper to scan; ask the planner what it would do at scale
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_product_filters(self):
+        self.assertUsesIndex(
+            ProductFilters({'category': 'Computer', 'min_price': 10, 'max_price': 50}, Products.objects.all()).qs,
+            'products_category_price_idx',
+        )
+        self.assertUsesIndex(
+            ProductFilters({'brand': 'logitech'}, Products.objects.all()).qs.order_by('price', 'id'),
+            'products_brand_price_idx',
+        )
+
+    def test_category_and_brand_ignore_case(self):
+        for params in ({'brand': 'logitech'}, {'brand': 'LOGITECH'}, {'category': 'computer'}):
+            self.assertEqual(list(ProductFilters(params, Products.objects.all()).qs), [self.product], params)
+        self.assertFalse(ProductFilters({'brand': 'logi'}, Products.objects.all()).qs.exists())
+
+    def test_catalog_sort_orders(self):
+        self.assertUsesIndex(Products.objects.order_by('-created_at', '-id')[:20], 'products_created_idx')
+        self.assertUsesIndex(Products.objects.order_by('price', 'id')[:20], 'products_price_idx')
+
+    def test_product_reviews(self):
+        reviews = Reviews.objects.filter(product=self.product)
+        self.assertUsesIndex(reviews.order_by('-created_at', '-id')[:10], 'reviews_product_created_idx')
+        self.assertUsesIndex(reviews.order_by('-rating', '-created_at')[:10], 'reviews_product_rating_idx')
+
+
+class BatchProductsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = User.objects.create_user(username='vendor', password='testpassword')
+        self.other = User.objects.create_user(username='other', password='testpassword')
+        self.mine = [
+            Products.objects.create(name=f'SSD {i}', brand='Kingston', category='Computer', price=Decimal('50.00'),
+                                    description='ssd', stock=10, user=self.vendor)
+            for i in range(3)
+        ]
+        self.theirs = Products.objects.create(name='HDD', brand='Seagate', category='Computer', price=Decimal('40.00'),
+                                              description='hdd', stock=10, user=self.other)
+        self.client.force_authenticate(self.vendor)
+        self.url = '/api/products/batch_products/'
+
+    def test_mixed_batch_reports_per_item_results(self):
+        response = self.client.post(self.url, {'operations': [
+            {'op': 'update', 'id': str(self.mine[0].pk), 'data': {'price': '45.00', 'stock': 7}},
+            {'op': 'update', 'id': str(self.mine[1].pk), 'data': {'price': '44.00'}},
+            {'op': 'delete', 'id': str(self.mine[2].pk)},
+            {'op': 'create', 'data': {'name': 'NVMe', 'brand': 'Samsung', 'category': 'Computer',
+                                      'price': '120.00', 'description': 'fast', 'stock': 2}},
+            {'op': 'update', 'id': str(self.theirs.pk), 'data': {'price': '1.00'}},
+            {'op': 'update', 'id': str(self.mine[0].pk), 'data': {'price': 'free'}},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary'], {'created': 1, 'updated': 2, 'deleted': 1, 'error': 2})
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['updated', 'updated', 'deleted', 'created', 'error', 'error'])
+        first = Products.objects.get(pk=self.mine[0].pk)
+        self.assertEqual((first.price, first.stock), (Decimal('45.00'), 7))
+        self.assertFalse(Products.objects.filter(pk=self.mine[2].pk).exists())
+        self.assertEqual(Products.objects.get(pk=self.theirs.pk).price, Decimal('40.00'))
+        self.assertEqual(Products.objects.get(name='NVMe').user, self.vendor)
+        self.assertEqual([p.name for p in get_search_backend().search(Products.objects.all(), 'nvme')], ['NVMe'])
+
+    def test_repricing_runs_a_fixed_number_of_queries(self):
+        for count in (1, 3):
+            operations = [{'op': 'update', 'id': str(p.pk), 'data': {'price': '30.00'}} for p in self.mine[:count]]
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.url, {'operations': operations}, format='json')
+            if count == 1:
+                baseline = len(queries)
+        self.assertEqual(len(queries), baseline)
+
+    def test_updates_only_write_the_fields_each_operation_set(self):
+        restocked, repriced = self.mine[0], self.mine[1]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'operations': [
+                {'op': 'update', 'id': str(restocked.pk), 'data': {'stock': 3}},
+                {'op': 'update', 'id': str(repriced.pk), 'data': {'price': '20.00'}},
+            ]}, format='json')
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and repriced.pk.hex in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"stock"', updates[0])
+        self.assertEqual(Products.objects.get(pk=restocked.pk).stock, 3)
+        self.assertEqual(Products.objects.get(pk=repriced.pk).price, Decimal('20.00'))
+
+    def test_limits(self):
+        response = self.client.post(self.url, {'operations': [{'op': 'delete', 'id': 'x'}] * 501}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AutocompleteTests(APITestCase):
+    def setUp(self):
+        reset_index()
+        self.addCleanup(reset_index)
+        user = User.objects.create_user(username='vendor', password='pass')
+        self.galaxy = Products.objects.create(name='Galaxy S24', brand='Samsung', category='Mobile', price=Decimal('900.00'),
+                                              description='phone', stock=5, user=user)
+        self.tab = Products.objects.create(name='Galaxy Tab', brand='Samsung', category='Mobile', price=Decimal('500.00'),
+                                           description='tablet', stock=5, user=user)
+        Products.objects.filter(pk=self.tab.pk).update(review_count=12)
+        self.url = '/api/products/autocomplete/'
+
+    def test_prefix_matches_names_words_and_brands_by_popularity(self):
+        response = self.client.get(self.url, {'q': 'gal'})
+        self.assertEqual([s['name'] for s in response.data['data']], ['Galaxy Tab', 'Galaxy S24'])
+        response = self.client.get(self.url, {'q': 'S2'})
+        self.assertEqual([s['name'] for s in response.data['data']], ['Galaxy S24'])
+        response = self.client.get(self.url, {'q': 'sams', 'k': 1})
+        self.assertEqual([s['name'] for s in response.data['data']], ['Galaxy Tab'])
+
+    def test_keystrokes_do_not_query_the_database(self):
+        self.client.get(self.url, {'q': 'g'})
+        with CaptureQueriesContext(connection) as queries:
+            for prefix in ('g', 'ga', 'gal', 'gala'):
+                self.client.get(self.url, {'q': prefix})
+        self.assertEqual(len(queries), 0)
+
+    def test_index_is_patched_from_product_signals(self):
+        self.client.get(self.url, {'q': 'g'})
+        self.galaxy.name = 'Pixel 9'
+        self.galaxy.save()
+        self.tab.delete()
+        self.assertEqual(self.client.get(self.url, {'q': 'gal'}).data['data'], [])
+        self.assertEqual([s['name'] for s in self.client.get(self.url, {'q': 'pix'}).data['data']], ['Pixel 9'])
+
+    def test_removing_keeps_other_terms_sorted(self):
+        index = PrefixIndex([(1, 'Alpha Beta', 'Acme', 1), (2, 'Alpine', 'Acme', 2)])
+        index.remove(1)
+        self.assertEqual(index.keys, sorted(index.keys))
+        self.assertEqual([s['id'] for s in index.suggest('al')], [2])
+        self.assertEqual(index.suggest('beta'), [])
+
+    def test_popularity_covers_the_whole_prefix_range(self):
+        rows = [(i, f'Aa {i:05}', 'Acme', 0) for i in range(3000)] + [(-1, 'Azure Lamp', 'Acme', 7)]
+        index = PrefixIndex(rows)
+        self.assertEqual(index.suggest('a', limit=1)[0]['id'], -1)
+        self.assertEqual(len(index.suggest('a', limit=25)), 25)
+
+
+class CoPurchaseRecommendationTests(APITestCase):
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='pass')
+        self.products = [
+            Products.objects.create(name=f'P{i}', brand='B', category='Computer', price=Decimal('10.00'),
+                                    description='d', stock=5, user=vendor)
+            for i in range(5)
+        ]
+        p = self.products
+        self.buy(User.objects.create_user(username='a', password='pass'), p[0], p[1])
+        self.buy(User.objects.create_user(username='b', password='pass'), p[0], p[1], p[2])
+        self.buy(User.objects.create_user(username='c', password='pass'), p[3])
+        wisher = User.objects.create_user(username='w', password='pass')
+        Wishlist.objects.create(user=wisher).products.add(p[0], p[4])
+        self.shopper = User.objects.create_user(username='shopper', password='pass')
+        self.buy(self.shopper, p[0])
+
+    def buy(self, user, *products):
+        order = Order.objects.create(user=user)
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, product_name=product.name, price=product.price)
+
+    def test_neighbours_are_ranked_by_co_occurrence(self):
+        build_product_neighbours.apply()
+        p = self.products
+        ranked = list(ProductNeighbour.objects.filter(product=p[0]).order_by('-score').values_list('neighbour', flat=True))
+        self.assertEqual(ranked, [p[1].pk, p[2].pk, p[4].pk])
+        self.assertFalse(ProductNeighbour.objects.filter(product=p[3]).exists())
+
+    def test_recommendations_merge_neighbours_of_recent_purchases(self):
+        build_product_neighbours.apply()
+        self.client.force_authenticate(self.shopper)
+        response = self.client.get('/api/products/recommended-products/')
+        names = [product['name'] for product in response.data]
+        self.assertEqual(names[:3], ['P1', 'P2', 'P4'])
+        self.assertNotIn('P0', names)
+        self.assertEqual(sorted(names), ['P1', 'P2', 'P3', 'P4'])
+
+
+class RecommendationCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        vendor = User.objects.create_user(username='vendor', password='pass')
+        self.products = [
+            Products.objects.create(name=f'P{i}', brand='B', category='Computer', price=Decimal('10.00'),
+                                    description='d', stock=5, user=vendor)
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user(username='shopper', password='pass')
+        self.client.force_authenticate(self.user)
+        self.url = '/api/products/recommended-products/'
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = self.client.get(self.url).data
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url).data
+        self.assertEqual(first, second)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(get_cache_stats(RECOMMENDATION_CACHE_STATS)['hits'], 1)
+
+    def test_cold_users_share_a_segment(self):
+        self.client.get(self.url)
+        other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(other)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        # Only the two history lookups, the popular list comes from the segment entry
+        self.assertEqual(len(queries), 2)
+
+    def test_wishlist_change_invalidates_the_user_entry(self):
+        self.client.get(self.url)
+        wishlist = Wishlist.objects.create(user=self.user)
+        wishlist.products.add(self.products[0])
+        names = [product['name'] for product in self.client.get(self.url).data]
+        self.assertNotIn('P0', names)
+        self.products[0].wishlisted_by.clear()
+        self.assertIn('P0', [product['name'] for product in self.client.get(self.url).data])
+
+
+class SimilarProductsTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(PRODUCT_SIMILARITY_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_similarity_index()
+        self.addCleanup(reset_similarity_index)
+        vendor = User.objects.create_user(username='vendor', password='pass')
+
+        def make(name, brand, category, price):
+            return Products.objects.create(name=name, brand=brand, category=category, price=Decimal(price),
+                                           description='d', stock=5, user=vendor)
+        self.laptop = make('Gaming Laptop 15', 'Dell', 'Computer', '1200.00')
+        self.other_laptop = make('Gaming Laptop 17', 'Dell', 'Computer', '1400.00')
+        self.mouse = make('Wireless Mouse', 'Logitech', 'Computer', '25.00')
+        self.cereal = make('Corn Flakes', 'Kellogg', 'Food', '4.00')
+        build_similarity_index()
+
+    def names(self, pk, **params):
+        response = self.client.get(f'/api/products/similar_products/{pk}/', params)
+        return [product['name'] for product in response.data['data']]
+
+    def test_most_similar_product_comes_first(self):
+        self.assertEqual(self.names(self.laptop.pk, k=2), ['Gaming Laptop 17', 'Wireless Mouse'])
+
+    def test_batched_query_matches_single_queries(self):
+        index = get_similarity_index()
+        batched = index.similar_many([self.laptop.pk, self.cereal.pk], k=3)
+        self.assertEqual(batched, [index.similar(self.laptop.pk, 3), index.similar(self.cereal.pk, 3)])
+        self.assertNotIn(self.cereal.pk, batched[0])
+
+    def test_rows_are_updated_in_place(self):
+        index = get_similarity_index()
+        self.mouse.name = 'Gaming Laptop 13'
+        self.mouse.save()
+        update_similarity_rows([self.mouse.pk])
+        # The mapped matrix of an already open index sees the new row at once
+        self.assertTrue(np.allclose(index.features[index.row_of(self.mouse.pk)], encode_products([self.mouse])[0]))
+        new = Products.objects.create(name='Gaming Laptop 15 Pro', brand='Dell', category='Computer',
+                                      price=Decimal('1250.00'), description='d', user=self.laptop.user)
+        cereal = self.cereal.pk
+        self.cereal.delete()
+        update_similarity_rows([new.pk, cereal])
+        reset_similarity_index()
+        index = get_similarity_index()
+        self.assertEqual(index.similar(self.laptop.pk, 1), [new.pk])
+        self.assertEqual(index.similar(cereal), [])
+        self.assertNotIn(cereal, index.similar(self.mouse.pk, 10))
+
+    def test_edits_keep_the_version_and_lookups_stay_sorted(self):
+        version = read_meta(similarity_dir())['version']
+        self.mouse.name = 'Gaming Mouse'
+        self.mouse.save()
+        update_similarity_rows([self.mouse.pk])
+        self.assertEqual(read_meta(similarity_dir())['version'], version)
+        added = [
+            Products.objects.create(name=f'Cable {i}', brand='Anker', category='Computer', price=Decimal('9.00'),
+                                    description='d', user=self.laptop.user)
+            for i in range(5)
+        ]
+        gone = self.other_laptop.pk
+        self.other_laptop.delete()
+        update_similarity_rows([product.pk for product in added] + [gone])
+        self.assertNotEqual(read_meta(similarity_dir())['version'], version)
+        index = get_similarity_index()
+        self.assertTrue(np.all(index.lookup['id'][:-1] < index.lookup['id'][1:]))
+        self.assertIsNone(index.row_of(gone))
+        for product in added + [self.laptop, self.mouse, self.cereal]:
+            row = index.row_of(product.pk)
+            self.assertEqual(index.ids[row], uuid.UUID(str(product.pk)).hex.encode())
+
+    def test_unindexed_product_falls_back_to_its_category(self):
+        new = Products.objects.create(name='Oats', brand='Quaker', category='Food', price=Decimal('3.00'),
+                                      description='d', user=self.laptop.user)
+        self.assertEqual(self.names(new.pk), ['Corn Flakes'])
+
+
+class TrendingProductsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        flush_events()
+        vendor = User.objects.create_user(username='vendor', password='pass')
+        self.laptop = Products.objects.create(name='Laptop', brand='Dell', category='Computer', price=Decimal('900.00'),
+                                              description='d', stock=5, user=vendor)
+        self.mouse = Products.objects.create(name='Mouse', brand='Logitech', category='Computer', price=Decimal('20.00'),
+                                             description='d', stock=5, user=vendor)
+        self.snack = Products.objects.create(name='Snack', brand='Lays', category='Food', price=Decimal('2.00'),
+                                             description='d', stock=5, user=vendor)
+
+    def test_events_are_buffered_and_flushed_in_one_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(50):
+                record_event(self.mouse.pk, 'cart')
+        self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            flush_events()
+        self.assertEqual(len([q for q in queries if 'INSERT' in q['sql']]), 1)
+        record_event(self.mouse.pk, 'order', quantity=2)
+        flush_events()
+        self.assertEqual(TrendingBucket.objects.get(product=self.mouse).score, 50 * 2.0 + 2 * 5.0)
+
+    def test_events_of_deleted_products_are_skipped(self):
+        record_event(uuid.uuid4(), 'order')
+        record_event(self.mouse.pk, 'cart')
+        flush_events()
+        self.assertEqual(list(TrendingBucket.objects.values_list('product_id', 'score')), [(self.mouse.pk, 2.0)])
+
+    def test_idle_buffer_is_flushed_by_a_timer(self):
+        with mock.patch('ProductsApp.trending.threading.Timer') as timer:
+            record_event(self.mouse.pk, 'cart')
+            record_event(self.mouse.pk, 'cart')
+        timer.assert_called_once_with(settings.TRENDING_FLUSH_SECONDS, mock.ANY)
+        flush_in_background = timer.call_args.args[1]
+        with mock.patch.object(connection, 'close'):
+            flush_in_background()
+        self.assertEqual(TrendingBucket.objects.get(product=self.mouse).score, 4.0)
+
+    def test_older_events_decay(self):
+        now = timezone.now()
+        record_event(self.laptop.pk, 'order', quantity=3, moment=now - timedelta(hours=48))
+        record_event(self.mouse.pk, 'order', quantity=1, moment=now)
+        record_event(self.snack.pk, 'order', quantity=1, moment=now - timedelta(hours=1))
+        refresh_trending(now)
+        ranking = get_trending()
+        self.assertEqual([pk for pk, _ in ranking], [self.mouse.pk, self.snack.pk, self.laptop.pk])
+        self.assertAlmostEqual(ranking[2][1], 15 * 0.25, places=3)
+        self.assertEqual([pk for pk, _ in get_trending('Food')], [self.snack.pk])
+
+    def test_endpoint_reads_the_ready_ranking(self):
+        buyer = User.objects.create_user(username='buyer', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            Wishlist.objects.create(user=buyer).products.add(self.snack)
+            Reviews.objects.create(product=self.laptop, user=buyer, rating=5, comment='ok')
+        refresh_trending()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/trending_products/', {'fields': 'id,name'})
+        self.assertEqual([p['name'] for p in response.data['data']], ['Snack', 'Laptop'])
+        self.assertEqual(response.data['data'][0]['trending_score'], 3.0)
+        self.assertEqual(len(queries), 1)
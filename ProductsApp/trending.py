@@ -0,0 +1,209 @@
+import atexit
+import logging
+import math
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from AccountsApp.models import Wishlist
+from .models import Products, Reviews, TrendingBucket, Categories
+
+logger = logging.getLogger(__name__)
+
+# Event kind -> points per unit
+EVENT_WEIGHTS = getattr(settings, 'TRENDING_EVENT_WEIGHTS', {'order': 5.0, 'cart': 2.0, 'wishlist': 3.0, 'review': 2.0})
+HALF_LIFE_HOURS = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24)
+# Buckets older than this many half-lives are worth < 3% and get pruned
+WINDOW_HOURS = HALF_LIFE_HOURS * 5
+TOP_N = getattr(settings, 'TRENDING_TOP_N', 50)
+FLUSH_EVENTS = getattr(settings, 'TRENDING_FLUSH_EVENTS', 500)
+FLUSH_SECONDS = getattr(settings, 'TRENDING_FLUSH_SECONDS', 10)
+ALL_CATEGORIES = 'all'
+
+
+def bucket_start(moment=None):
+    return (moment or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+
+class EventBuffer:
+    """
+    Per-process counters keyed by (product, hour). Events only touch this
+    dict; it is written out as one batched upsert every FLUSH_EVENTS events,
+    and a timer writes whatever is left FLUSH_SECONDS after the first
+    buffered event, so the event rate never reaches the database.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scores = {}
+        self.pending = 0
+        self.timer = None
+
+    def add(self, product_id, points, moment=None):
+        key = (str(product_id), bucket_start(moment))
+        with self.lock:
+            self.scores[key] = self.scores.get(key, 0.0) + points
+            self.pending += 1
+            due = self.pending >= FLUSH_EVENTS
+            if not due and self.timer is None:
+                # An idle process still writes its events out in time
+                self.timer = threading.Timer(FLUSH_SECONDS, self.flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+        if due:
+            self.flush()
+
+    def drain(self):
+        with self.lock:
+            scores, self.scores = self.scores, {}
+            self.pending = 0
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        return scores
+
+    def flush(self):
+        scores = self.drain()
+        if scores:
+            try:
+                write_buckets(scores)
+            except Exception:
+                # Trending is best effort; never fail the request that flushed
+                logger.exception('Could not write %s trending buckets', len(scores))
+        return len(scores)
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connection
+            connection.close()
+
+
+def write_buckets(scores):
+    # INSERT .. ON CONFLICT DO UPDATE adds to the stored score (SQLite >= 3.24 and PostgreSQL)
+    table = connection.ops.quote_name(TrendingBucket._meta.db_table)
+    product_field = TrendingBucket._meta.get_field('product').target_field
+    moment_field = TrendingBucket._meta.get_field('bucket_start')
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Products deleted since their events were buffered would fail the FK check
+        ids = {product_id for product_id, _ in scores}
+        alive = set(Products.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        rows = [
+            (product_field.get_db_prep_value(product_id, connection), moment_field.get_db_prep_value(moment, connection), points)
+            for (product_id, moment), points in scores.items()
+            if product_field.to_python(product_id) in alive
+        ]
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {table} (product_id, bucket_start, score) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (product_id, bucket_start) DO UPDATE SET score = {table}.score + excluded.score',
+                rows,
+            )
+
+
+_buffer = EventBuffer()
+atexit.register(_buffer.flush)
+
+
+def record_event(product_id, kind, quantity=1, moment=None):
+    """Count one event towards a product's trending score (buffered, no query)."""
+    if product_id is not None:
+        _buffer.add(product_id, EVENT_WEIGHTS[kind] * quantity, moment)
+
+
+def flush_events():
+    return _buffer.flush()
+
+
+def trending_cache_key(category):
+    return f'products:trending:{category}'
+
+
+def decayed_score(now):
+    """Sum of bucket scores, each multiplied by 2^(-age / half-life) of its hour."""
+    current = bucket_start(now)
+    weights = [
+        When(bucket_start=current - timedelta(hours=age), then=Value(math.pow(0.5, age / HALF_LIFE_HOURS)))
+        for age in range(WINDOW_HOURS)
+    ]
+    return Sum(F('score') * Case(*weights, default=Value(0.0), output_field=FloatField()), output_field=FloatField())
+
+
+def compute_trending(category=None, now=None, limit=TOP_N):
+    now = now or timezone.now()
+    buckets = TrendingBucket.objects.filter(bucket_start__gt=bucket_start(now) - timedelta(hours=WINDOW_HOURS))
+    if category not in (None, ALL_CATEGORIES):
+        buckets = buckets.filter(product__category=category)
+    ranking = (
+        buckets.values('product_id')
+        .annotate(trend=decayed_score(now))
+        .filter(trend__gt=0)
+        .order_by('-trend', 'product_id')[:limit]
+    )
+    return [(row['product_id'], round(row['trend'], 4)) for row in ranking]
+
+
+def refresh_trending(now=None):
+    """
+    Rebuild the cached top-N for every category and for the whole catalog,
+    then drop buckets that fell out of the window. Run by the beat schedule.
+    """
+    now = now or timezone.now()
+    flush_events()
+    timeout = getattr(settings, 'TRENDING_CACHE_TIMEOUT', 60 * 60)
+    rankings = {
+        trending_cache_key(category): compute_trending(category, now)
+        for category in [ALL_CATEGORIES] + [value for value, _ in Categories.choices]
+    }
+    cache.set_many(rankings, timeout)
+    TrendingBucket.objects.filter(bucket_start__lte=bucket_start(now) - timedelta(hours=WINDOW_HOURS)).delete()
+    return rankings
+
+
+def get_trending(category=ALL_CATEGORIES, limit=TOP_N):
+    """The ready ranking of (product id, score); computed once on a cold cache."""
+    ranking = cache.get(trending_cache_key(category))
+    if ranking is None:
+        ranking = compute_trending(category)
+        cache.set(trending_cache_key(category), ranking, getattr(settings, 'TRENDING_CACHE_TIMEOUT', 60 * 60))
+    return ranking[:limit]
+
+
+def on_commit_record(product_ids, kind, quantity=1):
+    # Rolled back orders and wishlist edits never count
+    transaction.on_commit(lambda: [record_event(product_id, kind, quantity) for product_id in product_ids])
+
+
+@receiver(post_save, sender='OrdersApp.OrderItem')
+def record_order_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        on_commit_record([instance.product_id], 'order', instance.quantity)
+
+
+@receiver(post_save, sender='OrdersApp.CartItem')
+def record_cart_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        on_commit_record([instance.product_id], 'cart')
+
+
+@receiver(post_save, sender=Reviews)
+def record_review_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        on_commit_record([instance.product_id], 'review')
+
+
+@receiver(m2m_changed, sender=Wishlist.products.through)
+def record_wishlist_event(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        on_commit_record([instance.pk], 'wishlist', len(pk_set))
+    else:
+        on_commit_record(list(pk_set), 'wishlist')
+
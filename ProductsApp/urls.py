@@ -7,6 +7,8 @@ from .views import RecommendedProductsView
 urlpatterns = [
     # Apps paths
     path('all_products/', views.get_all_products), # all_products/
+    # all_products/?stream=json  |  all_products/?stream=ndjson
+    # any product endpoint: ?fields=id,name,price,image&expand=reviews
     path('one_product/<str:pk>/', views.get_one_product), # one_product/<id>/
     path('get_filtered_products/', views.get_filtered_products),
     # get_filtered_products/?catagory=<brandName-frontend>
@@ -15,11 +17,21 @@ urlpatterns = [
     # get_filtered_products/?keyword=<price-frontend>
     # get_filtered_products/?minPrice=<price-frontend>
     # get_filtered_products/?maxPrice=<price-frontend>  
+    path('product_facets/', views.get_product_facets),
+    # product_facets/?<same filters as get_filtered_products>
+    path('autocomplete/', views.autocomplete), # autocomplete/?q=<typed-text>&k=<max-suggestions>
     path('get_filtered_pages/', views.get_filtered_pages),
+    # get_filtered_pages/?page=<n>&page_size=<n>
+    # get_filtered_pages/?pagination=cursor&ordering=<-created_at|created_at|-price|price>&page_size=<n>&skip_count=1
+    # get_filtered_pages/?cursor=<next-cursor-from-previous-response>
     path('add_product/', views.add_product),  # add_product/
     path('update_product/<str:pk>/', views.update_product), # update_product/<id>  
     path('delete_product/<str:pk>/', views.delete_product), # update_product/<id>  
+    path('batch_products/', views.batch_products), # batch_products/  {"operations": [...]}
     path('add_review/<str:pk>/', views.add_review), # update_product/<id>  
-    path('delete_review/<str:pk>/', views.add_review), # delete_review/<id>  
+    path('delete_review/<str:pk>/', views.delete_review), # delete_review/<id>  
+    path('trending_products/', views.get_trending_products), # trending_products/?category=<category>&k=<n>
+    path('similar_products/<str:pk>/', views.get_similar_products), # similar_products/<product-id>/?k=<n>
+    path('product_reviews/<str:pk>/', views.get_product_reviews), # product_reviews/<product-id>/?ordering=<-created_at|-rating|rating>&page_size=<n>
     path('recommended-products/', RecommendedProductsView.as_view(), name='recommended-products'),
 ]
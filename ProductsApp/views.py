@@ -1,53 +1,177 @@
+import uuid
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404, redirect, render
+from django.conf import settings
+from django.db import transaction
+from django.core.exceptions import ValidationError
+from django.views.decorators.http import condition
 from django.db.models import Avg
 from rest_framework.views import APIView
-from utils.recommendations import get_recommended_products
+from utils.recommendations import get_cached_recommendations
 from .models import Products, Reviews
 from OrdersApp.models import Order, OrderItem, Cart, CartItem
-from .serializers import SzProducts, SzReview, ProductSerializer
+from .serializers import SzProducts, SzReview, SzProductBatchItem
 from .filters import ProductFilters
+from .pagination import CatalogPageNumberPagination, KeysetPagination, ReviewKeysetPagination
+from .streaming import streaming_response
+from .facets import get_facets
+from .cache import get_product_payload, catalog_etag, catalog_last_modified, invalidate_products
+from .search import get_search_backend
+from .autocomplete import get_index, refresh_autocomplete
+from .similarity import get_similarity_index, schedule_similarity_update
+from .trending import get_trending, ALL_CATEGORIES, TOP_N
 
 
 def main(request):
     return render(request, 'main.html')
 
+# Optional ?reviews_limit=<n> keeps only the newest n reviews nested in each product
+def get_reviews_limit(request):
+    try:
+        return max(int(request.GET['reviews_limit']), 0)
+    except (KeyError, ValueError):
+        return None
+
+# ?fields=id,name,price,image returns only those fields, ?expand=reviews adds the nested reviews
+def get_requested_fields(request):
+    fields = request.GET.get('fields')
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(',') if name.strip()}
+    requested |= {name.strip() for name in request.GET.get('expand', '').split(',') if name.strip()}
+    return requested
+
+def catalog_queryset(request, queryset=None):
+    if queryset is None:
+        queryset = Products.objects.all()
+    return SzProducts.setup_eager_loading(
+        queryset, reviews_limit=get_reviews_limit(request), fields=get_requested_fields(request)
+    )
+
+def catalog_serializer(request, *args, **kwargs):
+    return SzProducts(*args, fields=get_requested_fields(request), **kwargs)
+
+# Cursor mode is used when the client asks for it or follows a `next` cursor link
+def wants_cursor_pagination(request):
+    return request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET
+
+def paginate_with_cursor(request, queryset):
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = catalog_serializer(request, page, many=True)
+    return paginator.get_paginated_response({'data': serializer.data})
+
 # To get all products on database
 @api_view(['GET'])
-def get_all_products(response): # api/products/all-products/
-    products = Products.objects.all()
-    serializer = SzProducts(products, many=True)
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+def get_all_products(request): # api/products/all-products/
+    products = catalog_queryset(request)
+    if wants_cursor_pagination(request):
+        return paginate_with_cursor(request, products)
+    # ?stream=json or ?stream=ndjson writes the rows out as they are read
+    stream = request.GET.get('stream')
+    if stream in ('json', 'ndjson'):
+        return streaming_response(products.order_by('created_at', 'id'), catalog_serializer(request), ndjson=stream == 'ndjson')
+    serializer = catalog_serializer(request, products, many=True)
     # print(f">>>>>>>>>{serializer}")
     return Response({'data': serializer.data})
 
 # To get specific product.
 @api_view(['GET'])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def get_one_product(request, pk): # api/products/one-product/<id-frontend>
-    the_product = get_object_or_404(Products, id=pk)
-    serializer = SzProducts(the_product, many=False)
-    return Response({'data': serializer.data})
+    reviews_limit = get_reviews_limit(request)
+
+    def load():
+        products = SzProducts.setup_eager_loading(Products.objects.all(), reviews_limit=reviews_limit)
+        return SzProducts(get_object_or_404(products, id=pk)).data
+
+    # The cache holds the full representation; sparse fieldsets are cut from it
+    payload = load() if reviews_limit is not None else get_product_payload(pk, load)
+    fields = get_requested_fields(request)
+    if fields is not None:
+        payload = {name: value for name, value in payload.items() if name in fields}
+    return Response({'data': payload})
 
 # To get products with filter 
 @api_view(['GET'])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def get_filtered_products(request):
-    products = Products.objects.all()
+    products = catalog_queryset(request)
     filterset = ProductFilters(request.GET, products.order_by("id"))
-    serializer = SzProducts(filterset.qs, many=True)
+    if wants_cursor_pagination(request):
+        return paginate_with_cursor(request, filterset.qs)
+    serializer = catalog_serializer(request, filterset.qs, many=True)
+    return Response({'data': serializer.data})
+
+# Category, brand, price and rating counts for the current filters in one call
+@api_view(['GET'])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+def get_product_facets(request):
+    facets = get_facets(request.GET, Products.objects.all())
+    return Response({'data': facets})
+
+# Search-as-you-type suggestions served from the in-process prefix index, no database query
+@api_view(['GET'])
+def autocomplete(request):
+    query = request.GET.get('q', '')
+    max_suggestions = getattr(settings, 'PRODUCT_AUTOCOMPLETE_MAX_SUGGESTIONS', 20)
+    try:
+        limit = min(max(int(request.GET.get('k', 10)), 1), max_suggestions)
+    except ValueError:
+        limit = 10
+    return Response({'data': get_index().suggest(query, limit)})
+
+# Products that look like this one (category, brand, price band, rating, name), from the feature matrix
+@api_view(['GET'])
+def get_similar_products(request, pk):
+    try:
+        k = min(max(int(request.GET.get('k', 10)), 1), 50)
+    except ValueError:
+        k = 10
+    index = get_similarity_index()
+    ids = index.similar(pk, k) if index is not None else []
+    if ids:
+        products = catalog_queryset(request, get_search_backend().order_by_ids(Products.objects.all(), ids))
+    else:
+        # Not encoded yet (new product or no index built): fall back to the best rated of the same category
+        product = get_object_or_404(Products.objects.only('id', 'category'), id=pk)
+        products = catalog_queryset(request, Products.objects.filter(category=product.category).exclude(pk=product.pk))
+        products = products.order_by('-rating', 'id')[:k]
+    serializer = catalog_serializer(request, products, many=True)
     return Response({'data': serializer.data})
 
+# "Trending now": products ranked by recent orders, cart adds, wishlists and reviews (precomputed)
+@api_view(['GET'])
+def get_trending_products(request):
+    category = request.GET.get('category') or ALL_CATEGORIES
+    try:
+        k = min(max(int(request.GET.get('k', 10)), 1), TOP_N)
+    except ValueError:
+        k = 10
+    ranking = get_trending(category, k)
+    scores = dict(ranking)
+    products = catalog_queryset(request, get_search_backend().order_by_ids(Products.objects.all(), list(scores)))
+    data = catalog_serializer(request, products, many=True).data
+    for item in data:
+        if 'id' in item:
+            item['trending_score'] = scores.get(uuid.UUID(str(item['id'])))
+    return Response({'data': data})
+
 # To get products with filter and seperate to pages
 @api_view(['GET'])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def get_filtered_pages(request):
-    products = Products.objects.all()
+    products = catalog_queryset(request)
     filterset = ProductFilters(request.GET, products.order_by("id"))
-    paginator = PageNumberPagination()
-    paginator.page_size = 2  # Set the number of items per page
+    if wants_cursor_pagination(request):
+        return paginate_with_cursor(request, filterset.qs)
+    paginator = CatalogPageNumberPagination()
     paginated_queryset = paginator.paginate_queryset(filterset.qs, request)
-    serializer = SzProducts(paginated_queryset, many=True)
+    serializer = catalog_serializer(request, paginated_queryset, many=True)
     return paginator.get_paginated_response({'data': serializer.data})
 
 # Add product
@@ -77,9 +201,9 @@ def update_product(request, pk):
         product.price = request.data['price']
         product.brand = request.data['brand']
         product.catagory = request.data['catagory']
-        product.rating = request.data['rating']
         product.stock = request.data['stock']
-        product.save()
+        # rating and its review aggregates belong to apply_review_delta, never write them back from here
+        product.save(update_fields=['name', 'description', 'price', 'brand', 'stock'])
         serializer = SzProducts(product, many=False)
         return Response({'data':serializer.data})
     
@@ -94,6 +218,87 @@ def delete_product(request, pk):
         product.delete()
         return Response({'result':'The product has been deleted'}, status=status.HTTP_200_OK)
 
+# Create, update and delete many products in one request
+# body: {"operations": [{"op": "create", "data": {...}}, {"op": "update", "id": "<id>", "data": {...}}, {"op": "delete", "id": "<id>"}]}
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_products(request):
+    operations = request.data.get('operations')
+    max_operations = getattr(settings, 'PRODUCT_BATCH_MAX_OPERATIONS', 500)
+    if not isinstance(operations, list) or not operations:
+        return Response({'error': 'operations must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(operations) > max_operations:
+        return Response({'error': f'at most {max_operations} operations per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+    ids = [op.get('id') for op in operations if isinstance(op, dict) and op.get('op') in ('update', 'delete')]
+    results, to_create, to_update, to_delete = [], [], {}, set()
+    with transaction.atomic():
+        # One query loads and locks every product the batch touches, ownership is checked in memory
+        try:
+            existing = Products.objects.select_for_update().in_bulk([pk for pk in ids if pk])
+        except ValidationError:
+            return Response({'error': 'invalid product id in operations'}, status=status.HTTP_400_BAD_REQUEST)
+        existing = {str(pk): product for pk, product in existing.items()}
+
+        for index, op in enumerate(operations):
+            kind = op.get('op') if isinstance(op, dict) else None
+            result = {'index': index, 'op': kind}
+            results.append(result)
+            if kind not in ('create', 'update', 'delete'):
+                result.update(status='error', errors={'op': 'must be create, update or delete'})
+                continue
+            if kind == 'create':
+                serializer = SzProductBatchItem(data=op.get('data') or {})
+                if not serializer.is_valid():
+                    result.update(status='error', errors=serializer.errors)
+                    continue
+                product = Products(user=request.user, **serializer.validated_data)
+                to_create.append(product)
+                result.update(status='created', id=str(product.pk))
+                continue
+
+            product = existing.get(str(op.get('id')))
+            result['id'] = op.get('id')
+            if product is None or str(product.pk) in to_delete:
+                result.update(status='error', errors={'id': 'product not found'})
+            elif product.user_id != request.user.id:
+                result.update(status='error', errors={'id': 'you dont have permission to edit this item'})
+            elif kind == 'delete':
+                to_delete.add(str(product.pk))
+                to_update.pop(str(product.pk), None)
+                result['status'] = 'deleted'
+            else:
+                serializer = SzProductBatchItem(product, data=op.get('data') or {}, partial=True)
+                if not serializer.is_valid():
+                    result.update(status='error', errors=serializer.errors)
+                    continue
+                for field, value in serializer.validated_data.items():
+                    setattr(product, field, value)
+                to_update.setdefault(str(product.pk), (product, set()))[1].update(serializer.validated_data)
+                result['status'] = 'updated'
+
+        if to_create:
+            Products.objects.bulk_create(to_create)
+        # Each product only writes the fields its own operations set, so a
+        # price change never writes back a stock value read earlier
+        groups = {}
+        for product, fields in to_update.values():
+            groups.setdefault(tuple(sorted(fields)), []).append(product)
+        for fields, products in groups.items():
+            if fields:
+                Products.objects.bulk_update(products, fields, batch_size=500)
+        if to_delete:
+            Products.objects.filter(pk__in=to_delete).delete()
+
+    # Bulk writes skip the model signals, so refresh search and caches here
+    changed = to_create + [product for product, _ in to_update.values()]
+    get_search_backend().index_products(changed)
+    refresh_autocomplete(changed)
+    schedule_similarity_update([product.pk for product in changed])
+    invalidate_products([product.pk for product in changed])
+    summary = {name: sum(1 for r in results if r['status'] == name) for name in ('created', 'updated', 'deleted', 'error')}
+    return Response({'summary': summary, 'results': results})
+
 # Add review
 # @api_view(['POST'])
 # @permission_classes([IsAuthenticated])
@@ -158,12 +363,20 @@ def add_review(request, pk):
 
 
 
+# Reviews of one product, newest first (?ordering=-rating|rating), one cursor page at a time
 @api_view(['GET'])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def get_product_reviews(request, pk):
     product = get_object_or_404(Products, id=pk)
-    reviews = product.reviews.all()
-    serializer = SzReview(reviews, many=True)
-    return Response({'reviews': serializer.data})
+    paginator = ReviewKeysetPagination()
+    page = paginator.paginate_queryset(product.reviews.select_related('user'), request)
+    serializer = SzReview(page, many=True)
+    return paginator.get_paginated_response({
+        'review_count': product.review_count,
+        'rating': product.rating,
+        'histogram': product.rating_histogram(),
+        'reviews': serializer.data,
+    })
 
 # delete review
 @api_view(['DELETE'])
@@ -180,9 +393,7 @@ class RecommendedProductsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        recommended_products = get_recommended_products(request.user)
-        serializer = ProductSerializer(recommended_products, many=True)
-        return Response(serializer.data)
+        return Response(get_cached_recommendations(request.user))
 
 
 
@@ -154,6 +154,7 @@ REST_FRAMEWORK = {
     #     'rest_framework.permissions.IsAuthenticated',
     # ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'EXCEPTION_HANDLER': 'utils.error_view.api_exception_handler',
 }
 
 SIMPLE_JWT = {
@@ -171,6 +172,31 @@ DJOSER = {
 
 }
 
+# Product keyword search (ProductsApp/search.py)
+# The backend is picked from the database vendor when this is not set
+# PRODUCT_SEARCH_BACKEND = 'ProductsApp.search.PostgresSearchBackend'
+
+# Filter counts served by api/products/product_facets/
+PRODUCT_FACETS_PRICE_BUCKET_SIZE = 100
+PRODUCT_FACETS_CACHE_TIMEOUT = 300
+
+# In-process prefix index behind api/products/autocomplete/
+# Workers rebuild it this often at most when another process changed the catalog
+PRODUCT_AUTOCOMPLETE_REFRESH_SECONDS = 300
+PRODUCT_AUTOCOMPLETE_MAX_SUGGESTIONS = 20
+
+# Memory-mapped product feature matrix behind api/products/similar_products/
+PRODUCT_SIMILARITY_DIR = BASE_DIR / 'similarity_index'
+PRODUCT_SIMILARITY_REFRESH_SECONDS = 10
+
+# "Trending now" rail (ProductsApp/trending.py): event points decay by half every TRENDING_HALF_LIFE_HOURS
+TRENDING_EVENT_WEIGHTS = {'order': 5.0, 'cart': 2.0, 'wishlist': 3.0, 'review': 2.0}
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_TOP_N = 50
+# Each worker buffers events and writes them out after this many events, or this many seconds after the first one
+TRENDING_FLUSH_EVENTS = 500
+TRENDING_FLUSH_SECONDS = 10
+
 # Redis Cache Configuration
 CACHES = {
     'default': {
@@ -182,11 +208,58 @@ CACHES = {
     }
 }
 
+# Cart storage: 'database' writes Cart/CartItem on every change, 'redis' keeps
+# active carts as hashes in the default cache and writes them back in batches
+# (OrdersApp/cart_store.py, flushed every 30 s and at checkout)
+CART_STORE = 'database'
+CART_STORE_FLUSH_BATCH = 500
+CART_STORE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Largest number of operations accepted by api/products/batch_products/
+PRODUCT_BATCH_MAX_OPERATIONS = 500
+
+# Serialized product detail pages, invalidated by product and review signals
+PRODUCT_CACHE_TIMEOUT = 60 * 60
+
 # Celery settings
 CELERY_BROKER_URL = 'redis://redis:6379/0'  # Redis container as the broker
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+CELERY_BEAT_SCHEDULE = {
+    # Co-purchase neighbours behind api/products/recommended-products/
+    'build-product-neighbours': {
+        'task': 'ProductsApp.tasks.build_product_neighbours',
+        'schedule': 60 * 60 * 6,
+    },
+    'warm-recommendations': {
+        'task': 'ProductsApp.tasks.warm_recommendations_for_active_users',
+        'schedule': 60 * 10,
+    },
+    'reconcile-wishlist-counts': {
+        'task': 'ProductsApp.tasks.reconcile_wishlist_counts',
+        'schedule': 60 * 60 * 24,
+    },
+    'rebuild-similar-products': {
+        'task': 'ProductsApp.tasks.rebuild_similar_products',
+        'schedule': 60 * 60 * 24,
+    },
+    'refresh-trending-products': {
+        'task': 'ProductsApp.tasks.refresh_trending_products',
+        'schedule': 60 * 5,
+    },
+    'flush-cart-store': {
+        'task': 'OrdersApp.tasks.flush_cart_store',
+        'schedule': 30,
+    },
+}
+
+# Item-to-item recommendations (utils/recommendations.py)
+RECOMMENDATION_NEIGHBOURS = 20
+RECOMMENDATION_PURCHASE_WEIGHT = 1.0
+RECOMMENDATION_WISHLIST_WEIGHT = 0.5
+# Per-user results, dropped when the user's orders or wishlist change
+RECOMMENDATION_CACHE_TIMEOUT = 60 * 15
 
 # Initialize Celery app
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ProjectFiles.settings')
@@ -0,0 +1,29 @@
+from django.core.cache import cache
+
+STATS_PREFIX = 'stats:cache'
+
+
+def record_cache_stat(name, hit):
+    """Count a hit or a miss for the named cache (shared by all workers)."""
+    key = f"{STATS_PREFIX}:{name}:{'hits' if hit else 'misses'}"
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def get_cache_stats(name):
+    hits = cache.get(f'{STATS_PREFIX}:{name}:hits', 0)
+    misses = cache.get(f'{STATS_PREFIX}:{name}:misses', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_cache_stats(name):
+    cache.delete_many([f'{STATS_PREFIX}:{name}:hits', f'{STATS_PREFIX}:{name}:misses'])
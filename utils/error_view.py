@@ -1,5 +1,9 @@
 # you must disable DEBUG in setting to use this error handling file
+from django.core.exceptions import ValidationError
 from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
 
 def handler_404(request, exception):
     message = 'Page Not Found'
@@ -11,4 +15,11 @@ def handler_500(request):
     message = 'Error In Internal Server'
     response = JsonResponse(data={'error': message})
     response.status_code = 500
-    return response
\ No newline at end of file
+    return response
+
+def api_exception_handler(exc, context):
+    # Model-level ValidationErrors (e.g. an invalid order status move) are client errors, not 500s
+    if isinstance(exc, ValidationError):
+        code = status.HTTP_409_CONFLICT if getattr(exc, 'code', None) == 'conflict' else status.HTTP_400_BAD_REQUEST
+        return Response({'error': ' '.join(exc.messages)}, status=code)
+    return exception_handler(exc, context)
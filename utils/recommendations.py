@@ -1,15 +1,226 @@
-from ProductsApp.models import Products
-from django.db.models import Count
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from ProductsApp.models import Products, ProductNeighbour
+from ProductsApp.serializers import SzProducts
+from OrdersApp.models import Order, OrderItem
+from AccountsApp.models import Wishlist
+from .cache_stats import record_cache_stat
 
-def get_recommended_products(user):
+# How much one interaction counts towards co-occurrence
+PURCHASE_WEIGHT = getattr(settings, 'RECOMMENDATION_PURCHASE_WEIGHT', 1.0)
+WISHLIST_WEIGHT = getattr(settings, 'RECOMMENDATION_WISHLIST_WEIGHT', 0.5)
+NEIGHBOURS_PER_PRODUCT = getattr(settings, 'RECOMMENDATION_NEIGHBOURS', 20)
+RECENT_PURCHASES = getattr(settings, 'RECOMMENDATION_RECENT_PURCHASES', 20)
+RECOMMENDATION_CACHE_TIMEOUT = getattr(settings, 'RECOMMENDATION_CACHE_TIMEOUT', 15 * 60)
+RECOMMENDATION_CACHE_STATS = 'recommendations'
+
+
+def interaction_matrix():
     """
-    Generate product recommendations based on the most popular products
-    or products frequently added to wishlists.
+    Sparse users x products matrix of purchase and wishlist weights, plus the
+    product ids of its columns. Cancelled orders are left out.
+    """
+    purchases = (
+        OrderItem.objects.filter(product__isnull=False, order__user__isnull=False)
+        .exclude(order__status='Cancelled')
+        .values_list('order__user_id', 'product_id')
+        .distinct()
+    )
+    wishlisted = Wishlist.products.through.objects.values_list('wishlist__user_id', 'products_id')
+
+    user_index, product_index = {}, {}
+    rows, columns, weights = [], [], []
+    for pairs, weight in ((purchases, PURCHASE_WEIGHT), (wishlisted, WISHLIST_WEIGHT)):
+        for user_id, product_id in pairs.iterator(chunk_size=10000):
+            rows.append(user_index.setdefault(user_id, len(user_index)))
+            columns.append(product_index.setdefault(product_id, len(product_index)))
+            weights.append(weight)
+
+    matrix = sparse.coo_matrix(
+        (np.array(weights, dtype=np.float32), (np.array(rows, dtype=np.int32), np.array(columns, dtype=np.int32))),
+        shape=(len(user_index), len(product_index)),
+    ).tocsr()
+    # A product both bought and wishlisted by the same user counts once at the higher weight
+    matrix.data = np.minimum(matrix.data, max(PURCHASE_WEIGHT, WISHLIST_WEIGHT))
+    return matrix, list(product_index)
+
+
+def top_neighbours(matrix, k=NEIGHBOURS_PER_PRODUCT):
+    """
+    Item-item cosine similarity of the interaction columns (XᵀX scaled by the
+    column norms), keeping the k best neighbours of every product. Yields
+    (column, neighbour column, score) triples.
+    """
+    co_occurrence = (matrix.T @ matrix).tocsr()
+    norms = np.sqrt(co_occurrence.diagonal())
+    norms[norms == 0] = 1.0
+    co_occurrence.setdiag(0)
+    co_occurrence.eliminate_zeros()
+    scale = sparse.diags(1.0 / norms)
+    similarity = (scale @ co_occurrence @ scale).tocsr()
+
+    for column in range(similarity.shape[0]):
+        start, end = similarity.indptr[column], similarity.indptr[column + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        neighbours = similarity.indices[start:end]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+            scores, neighbours = scores[best], neighbours[best]
+        for position in np.argsort(-scores, kind='stable'):
+            yield column, neighbours[position], float(scores[position])
+
+
+def build_product_neighbours(k=NEIGHBOURS_PER_PRODUCT, batch_size=5000):
+    """Rebuild the ProductNeighbour table; returns the number of rows written."""
+    matrix, product_ids = interaction_matrix()
+    rows = [
+        ProductNeighbour(product_id=product_ids[column], neighbour_id=product_ids[neighbour], score=score)
+        for column, neighbour, score in top_neighbours(matrix, k)
+    ] if len(product_ids) else []
+    with transaction.atomic():
+        ProductNeighbour.objects.all().delete()
+        ProductNeighbour.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def get_popular_products(limit=10, exclude=(), queryset=None):
+    if queryset is None:
+        queryset = Products.objects.all()
+    # Reads the head of products_wishlist_count_idx
+    return list(queryset.exclude(pk__in=exclude).order_by('-wishlist_count', 'id')[:limit])
+
+
+def get_seed_products(user):
+    # The user's recent purchases and wishlist, the starting points for recommendations
+    seeds = list(
+        OrderItem.objects.filter(order__user=user, product__isnull=False)
+        .order_by('-order__created_at')
+        .values_list('product_id', flat=True)[:RECENT_PURCHASES]
+    )
+    seeds += Wishlist.products.through.objects.filter(wishlist__user=user).values_list('products_id', flat=True)
+    return set(seeds)
+
+
+def get_recommended_products(user, limit=10, queryset=None, seeds=None):
+    """
+    Personalized recommendations: the stored neighbours of the user's recent
+    purchases and wishlist, summed by score, topped up with the most
+    wishlisted products for users without history. `queryset` lets the caller
+    choose how the products are loaded.
     """
     if not user.is_authenticated:
         return []
+    if queryset is None:
+        queryset = Products.objects.all()
+    if seeds is None:
+        seeds = get_seed_products(user)
+
+    scores = {}
+    neighbours = (
+        ProductNeighbour.objects.filter(product_id__in=seeds)
+        .exclude(neighbour_id__in=seeds)
+        .values_list('neighbour_id', 'score')
+    )
+    for neighbour_id, score in neighbours:
+        scores[neighbour_id] = scores.get(neighbour_id, 0.0) + score
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+
+    found = queryset.filter(pk__in=ranked).in_bulk() if ranked else {}
+    recommended = [found[pk] for pk in ranked if pk in found]
+    if len(recommended) < limit:
+        recommended += get_popular_products(limit - len(recommended), seeds | set(found), queryset)
+    return recommended
+
+
+def recommendation_cache_key(user_id):
+    return f'recommendations:user:{user_id}'
+
+
+def segment_cache_key(segment):
+    return f'recommendations:segment:{segment}'
+
+
+def render_recommendations(products):
+    return SzProducts(products, many=True).data
+
+
+def get_cached_recommendations(user, limit=10):
+    """
+    Serialized recommendations for `user`, from the cache when possible.
+    Users without any history share the 'cold' segment entry, their own key
+    only points at it. Entries are dropped when the user's orders or
+    wishlist change (receivers below); catalog edits show up within
+    RECOMMENDATION_CACHE_TIMEOUT.
+    """
+    if not user.is_authenticated:
+        return []
+    entry = cache.get(recommendation_cache_key(user.pk))
+    payload = None
+    if entry is not None:
+        payload = cache.get(segment_cache_key(entry['segment'])) if 'segment' in entry else entry['data']
+    record_cache_stat(RECOMMENDATION_CACHE_STATS, hit=payload is not None)
+    if payload is None:
+        payload = warm_recommendations(user, limit)
+    return payload
+
+
+def warm_recommendations(user, limit=10):
+    queryset = SzProducts.setup_eager_loading(Products.objects.all())
+    seeds = get_seed_products(user)
+    key = recommendation_cache_key(user.pk)
+    if not seeds:
+        segment = segment_cache_key('cold')
+        payload = cache.get(segment)
+        if payload is None:
+            payload = render_recommendations(get_popular_products(limit, queryset=queryset))
+            cache.set(segment, payload, RECOMMENDATION_CACHE_TIMEOUT)
+        cache.set(key, {'segment': 'cold'}, RECOMMENDATION_CACHE_TIMEOUT)
+        return payload
+    payload = render_recommendations(get_recommended_products(user, limit, queryset, seeds=seeds))
+    cache.set(key, {'data': payload}, RECOMMENDATION_CACHE_TIMEOUT)
+    return payload
+
+
+def invalidate_recommendations(user_ids):
+    keys = [recommendation_cache_key(user_id) for user_id in user_ids if user_id is not None]
+    if keys:
+        cache.delete_many(keys)
+
+
+@receiver(m2m_changed, sender=Wishlist.products.through)
+def invalidate_wishlist_recommendations(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # A product added to or removed from wishlists: pk_set holds wishlist ids
+        if action in ('post_add', 'post_remove'):
+            wishlists = Wishlist.objects.filter(pk__in=pk_set)
+        elif action == 'pre_clear':
+            wishlists = instance.wishlisted_by.all()
+        else:
+            return
+        invalidate_recommendations(wishlists.values_list('user_id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_recommendations([instance.user_id])
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_recommendations(sender, instance, **kwargs):
+    # After commit, so a checkout is seen together with its items
+    transaction.on_commit(lambda: invalidate_recommendations([instance.user_id]))
 
-    # Get products frequently added to wishlists
-    popular_products = Products.objects.annotate(wishlist_count=Count('wishlisted_by')).order_by('-wishlist_count')[:10]
 
-    return popular_products
\ No newline at end of file
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_order_item_recommendations(sender, instance, **kwargs):
+    if OrderItem._meta.get_field('order').is_cached(instance):
+        user_id = instance.order.user_id
+    else:
+        user_id = Order.objects.filter(pk=instance.order_id).values_list('user_id', flat=True).first()
+    invalidate_recommendations([user_id])